@@ -6,6 +6,10 @@ Questo script crea e popola il database operazionale (OLTP) di TechStore.
 
 Esecuzione:
     python 01_setup_database.py
+    python 01_setup_database.py --bulk [--journal wal]
+    python 01_setup_database.py --confronta
+    python 01_setup_database.py --scale-factor 10
+    python 01_setup_database.py --data-riferimento 2025-06-30
 
 Output:
     - techstore_oltp.db (database SQLite)
@@ -14,20 +18,106 @@ Output:
 
 import sqlite3
 import random
+import importlib
+import os
+import tempfile
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from pathlib import Path
 from faker import Faker
+import numpy as np
 import sys
 
-# Configurazione
+# Configurazione (SF1: con --scale-factor clienti e ordini vengono moltiplicati,
+# dettagli, spedizioni e pagamenti seguono dagli ordini con le stesse distribuzioni)
 DB_PATH = '../techstore_oltp.db'
 N_CLIENTI = 20000
 N_ORDINI = 100000
 SEED = 42
+# Fine della finestra temporale di clienti (1095 giorni) e ordini (730):
+# una data fissa e non "oggi", così stesso SEED, N_SHARD e scale factor
+# danno lo stesso dataset in qualunque giorno. --data-riferimento la sposta.
+DATA_RIFERIMENTO = datetime(2025, 1, 1)
+
+# Generazione ordini in parallelo: N_SHARD intervalli di ordine_id, ognuno
+# con un seed derivato da (SEED, shard). Stesso (SEED, N_SHARD) -> stessi dati,
+# qualunque sia il numero di processi.
+N_SHARD = 8
+N_PROCESSI = os.cpu_count() or 1
+# Nel profilo bulk tutti gli shard restano in ATTACH fino al commit:
+# SQLite ne permette al più 10 (SQLITE_MAX_ATTACHED di default)
+MAX_SHARD_ATTACH = 10
+
+# Ordini generati e inseriti per transazione: la memoria dipende da questo,
+# non da N_ORDINI. Fa parte della definizione dei dati (come il seed).
+BLOCCO_ORDINI = 50000
+
+# Clienti generati da pool di valori Faker: POOL_FAKER valori per campo,
+# estratti una volta e salvati su disco (un file per locale e seed), poi
+# clienti per estrazione di indici a blocchi di BLOCCO_CLIENTI.
+# Le città non passano da city(): per it_IT pesca da una lista il cui ordine
+# cambia a ogni processo (hash seed), il pool è la lista ordinata.
+LOCALE = 'it_IT'
+POOL_FAKER = 5000
+BLOCCO_CLIENTI = 100000
+POOL_CAMPI = {
+    'nome': ('first_name',),
+    'cognome': ('last_name',),
+    'telefono': ('phone_number',),
+    'regione': ('region', 'administrative_unit'),  # region non c'è nelle Faker recenti
+    'cap': ('postcode',),
+    'dominio': ('free_email_domain',),
+}
+SEGMENTI = ['Bronze', 'Silver', 'Gold', 'Platinum']
+PESI_SEGMENTI = [0.5, 0.3, 0.15, 0.05]
+
+# Indici secondari: creati subito con il profilo standard, dopo il
+# caricamento con il profilo bulk. ANALYZE alla fine in entrambi i casi.
+INDICI = [
+    "CREATE UNIQUE INDEX idx_clienti_email ON clienti(email)",
+    "CREATE INDEX idx_prodotti_categoria ON prodotti(categoria_id)",
+    "CREATE INDEX idx_ordini_cliente ON ordini(cliente_id)",
+    "CREATE INDEX idx_ordini_data ON ordini(data_ordine)",
+    "CREATE INDEX idx_dettagli_ordine ON dettagli_ordini(ordine_id)",
+    "CREATE INDEX idx_dettagli_prodotto ON dettagli_ordini(prodotto_id)",
+    "CREATE INDEX idx_spedizioni_ordine ON spedizioni(ordine_id)",
+    "CREATE INDEX idx_pagamenti_ordine ON pagamenti(ordine_id)",
+]
+
+# Profilo bulk: niente journal (o WAL) e niente fsync durante il caricamento.
+# Alla fine si torna a journal DELETE e synchronous FULL (i default SQLite).
+JOURNAL_BULK = ('OFF', 'WAL')
+PRAGMA_BULK = {
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': -262144,  # KB: 256 MB di page cache
+}
+PRAGMA_STANDARD = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+}
+
+# Distribuzioni usate per generare gli ordini (stessi pesi per entrambi i generatori)
+STATI_ORDINE = ['Completato', 'In Elaborazione', 'Spedito', 'Consegnato', 'Cancellato']
+PESI_STATI = [0.7, 0.05, 0.1, 0.12, 0.03]
+CANALI = ['Web', 'Mobile App', 'Telefono']
+PESI_CANALI = [0.6, 0.35, 0.05]
+N_RIGHE = [1, 2, 3, 4, 5]
+PESI_N_RIGHE = [0.4, 0.3, 0.2, 0.07, 0.03]
+QUANTITA = [1, 2, 3]
+PESI_QUANTITA = [0.8, 0.15, 0.05]
+SCONTI = [0, 5, 10, 15, 20]
+PESI_SCONTI = [0.6, 0.2, 0.1, 0.07, 0.03]
+CORRIERI = ['DHL', 'UPS', 'FedEx', 'Poste Italiane', 'BRT']
+COSTI_SPEDIZIONE = [0, 4.99, 9.99]
+METODI_PAGAMENTO = ['Carta di Credito', 'PayPal', 'Bonifico', 'Contrassegno']
+PESI_PAGAMENTO = [0.5, 0.3, 0.1, 0.1]
 
 # Setup
 random.seed(SEED)
-fake = Faker('it_IT')
-Faker.seed(SEED)
 
 
 def print_progress(message, step=None, total=None):
@@ -39,8 +129,20 @@ def print_progress(message, step=None, total=None):
         print(f"[INFO] {message}")
 
 
-def create_tables(cursor):
-    """Crea le tabelle del database OLTP."""
+@contextmanager
+def cronometro(tempi, tabella):
+    """Somma in tempi[tabella] i secondi passati nel blocco (tempi None = niente)."""
+    t0 = time.perf_counter()
+    yield
+    if tempi is not None:
+        tempi[tabella] = tempi.get(tabella, 0.0) + time.perf_counter() - t0
+
+
+def create_tables(cursor, indici=True):
+    """
+    Crea le tabelle del database OLTP. Con indici=False gli INDICI secondari
+    (compreso quello UNIQUE sull'email) vengono lasciati a create_indexes.
+    """
     print_progress("Creazione tabelle...")
     
     # Drop tabelle se esistono
@@ -66,7 +168,7 @@ def create_tables(cursor):
         cliente_id INTEGER PRIMARY KEY,
         nome VARCHAR(100) NOT NULL,
         cognome VARCHAR(100) NOT NULL,
-        email VARCHAR(150) UNIQUE NOT NULL,
+        email VARCHAR(150) NOT NULL,
         telefono VARCHAR(20),
         citta VARCHAR(100),
         regione VARCHAR(50),
@@ -142,10 +244,35 @@ def create_tables(cursor):
     )
     """)
     
+    if indici:
+        create_indexes(cursor)
+    
     print_progress("✓ Tabelle create con successo")
 
 
-def populate_categorie(cursor):
+def create_indexes(cursor):
+    """Crea gli INDICI secondari."""
+    for sql in INDICI:
+        cursor.execute(sql)
+
+
+def check_integrity(cursor):
+    """integrity_check e foreign_key_check: solleva un errore se qualcosa non va."""
+    risultato = [riga[0] for riga in cursor.execute("PRAGMA integrity_check")]
+    if risultato != ['ok']:
+        raise sqlite3.DatabaseError(f"integrity_check fallito: {risultato[:5]}")
+    violazioni = cursor.execute("PRAGMA foreign_key_check").fetchall()
+    if violazioni:
+        raise sqlite3.DatabaseError(f"{len(violazioni):,} violazioni di foreign key, "
+                                    f"es. {violazioni[:3]}")
+
+
+def set_pragmas(conn, pragmas):
+    for nome, valore in pragmas.items():
+        conn.execute(f"PRAGMA {nome} = {valore}")
+
+
+def populate_categorie(cursor, tempi=None):
     """Popola la tabella categorie."""
     print_progress("Popolamento categorie...")
     
@@ -160,11 +287,12 @@ def populate_categorie(cursor):
         (8, 'Smartwatch', 'Orologi intelligenti e fitness tracker')
     ]
     
-    cursor.executemany("INSERT INTO categorie VALUES (?, ?, ?)", categorie_data)
+    with cronometro(tempi, 'categorie'):
+        cursor.executemany("INSERT INTO categorie VALUES (?, ?, ?)", categorie_data)
     print_progress(f"✓ Inserite {len(categorie_data)} categorie")
 
 
-def populate_prodotti(cursor):
+def populate_prodotti(cursor, tempi=None):
     """Popola la tabella prodotti."""
     print_progress("Popolamento prodotti...")
     
@@ -233,172 +361,565 @@ def populate_prodotti(cursor):
             ))
             prodotto_id += 1
     
-    cursor.executemany("INSERT INTO prodotti VALUES (?, ?, ?, ?, ?, ?, ?)", prodotti_data)
+    with cronometro(tempi, 'prodotti'):
+        cursor.executemany("INSERT INTO prodotti VALUES (?, ?, ?, ?, ?, ?, ?)", prodotti_data)
     print_progress(f"✓ Inseriti {len(prodotti_data)} prodotti")
     
     return len(prodotti_data)
 
 
-def populate_clienti(cursor, n_clienti):
-    """Popola la tabella clienti."""
-    print_progress(f"Popolamento {n_clienti:,} clienti...")
-    
-    clienti_data = []
-    segmenti = ['Bronze', 'Silver', 'Gold', 'Platinum']
-    pesi_segmenti = [0.5, 0.3, 0.15, 0.05]
-    
-    data_inizio = datetime.now() - timedelta(days=1095)
-    data_fine = datetime.now()
-    
-    for i in range(1, n_clienti + 1):
-        nome = fake.first_name()
-        cognome = fake.last_name()
-        email = f"{nome.lower()}.{cognome.lower()}{i}@{fake.free_email_domain()}"
-        telefono = fake.phone_number()
-        citta = fake.city()
-        regione = fake.region()
-        cap = fake.postcode()
-        data_reg = fake.date_between(start_date=data_inizio, end_date=data_fine)
-        segmento = random.choices(segmenti, weights=pesi_segmenti)[0]
-        
-        clienti_data.append((
-            i, nome, cognome, email, telefono, citta, regione, cap, data_reg, segmento
-        ))
+def metodo_faker(generatore, nomi):
+    """Primo provider disponibile tra nomi (alcuni cambiano tra versioni di Faker)."""
+    for nome in nomi:
+        if hasattr(generatore, nome):
+            return getattr(generatore, nome)
+    raise AttributeError(f"Faker {generatore.locales} non ha nessuno di {nomi}")
+
+
+def pool_faker(locale=LOCALE, seed=SEED, dimensione=POOL_FAKER, cartella=None):
+    """
+    {campo: array di stringhe} con `dimensione` valori per ogni campo di
+    POOL_CAMPI. La prima volta li estrae da Faker(locale) con il seed dato,
+    poi li rilegge da cartella/faker_{locale}_{seed}_{dimensione}.npz
+    (default: cartella faker_pool accanto a DB_PATH). 'citta' è la lista
+    ordinata delle città del locale, non dipende dal seed.
+    """
+    if cartella is None:
+        cartella = Path(DB_PATH).resolve().parent / 'faker_pool'
+    path = Path(cartella) / f"faker_{locale}_{seed}_{dimensione}.npz"
+    pool = None
+    if path.exists():
+        with np.load(path) as f:
+            if set(POOL_CAMPI) <= set(f.files):
+                pool = {campo: f[campo] for campo in POOL_CAMPI}
+    
+    if pool is None:
+        generatore = Faker(locale)
+        generatore.seed_instance(seed)
+        pool = {}
+        for campo, nomi in POOL_CAMPI.items():
+            metodo = metodo_faker(generatore, nomi)
+            pool[campo] = np.array([metodo() for _ in range(dimensione)])
         
-        if i % 5000 == 0:
-            print_progress(f"Generati clienti...", i, n_clienti)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(tmp, **pool)
+        os.replace(tmp, path)
+    
+    provider = importlib.import_module(f"faker.providers.address.{locale}").Provider
+    pool['citta'] = np.array(sorted(provider.cities))
+    return pool
+
+
+def genera_clienti(rng, pool, primo_cliente_id, n_clienti, data_inizio, data_fine):
+    """
+    Blocco di clienti consecutivi come indici casuali nei pool, senza
+    chiamare Faker. L'email contiene il cliente_id e quindi resta unica
+    per qualsiasi numero di clienti.
+    """
+    cliente_id = np.arange(primo_cliente_id, primo_cliente_id + n_clienti)
+    valori = {campo: pool[campo][rng.integers(0, len(pool[campo]), size=n_clienti)]
+              for campo in pool}
+    email = np.char.add(np.char.add(np.char.lower(valori['nome']), '.'),
+                        np.char.lower(valori['cognome']))
+    email = np.char.add(np.char.add(email, cliente_id.astype(str)), '@')
+    email = np.char.add(email, valori['dominio'])
+    
+    giorni = (data_fine - data_inizio).days
+    data_reg = (np.datetime64(data_inizio.date(), 'D')
+                + rng.integers(0, giorni + 1, size=n_clienti).astype('timedelta64[D]'))
+    segmento = scegli(rng, SEGMENTI, PESI_SEGMENTI, n_clienti)
+    
+    return list(zip(cliente_id.tolist(), valori['nome'].tolist(), valori['cognome'].tolist(),
+                    email.tolist(), valori['telefono'].tolist(), valori['citta'].tolist(),
+                    valori['regione'].tolist(), valori['cap'].tolist(),
+                    date_sql(data_reg, 'D').tolist(), segmento.tolist()))
+
+
+def populate_clienti_pool(cursor, n_clienti, seed=SEED, data_fine=None, tempi=None):
+    """
+    Popola la tabella clienti con i pool di pool_faker: Faker viene usato
+    solo per riempire i pool (una volta per locale e seed), i clienti sono
+    estrazioni NumPy a blocchi di BLOCCO_CLIENTI. Stesso seed -> stessi dati.
+    data_fine (default: DATA_RIFERIMENTO) chiude la finestra di registrazione.
+    """
+    print_progress(f"Popolamento {n_clienti:,} clienti (pool Faker)...")
+    
+    pool = pool_faker(seed=seed)
+    # (seed, 1): sequenza diversa da quella degli ordini (default_rng(seed))
+    rng = np.random.default_rng((seed, 1))
+    if data_fine is None:
+        data_fine = DATA_RIFERIMENTO
+    data_inizio = data_fine - timedelta(days=1095)
+    
+    for inizio in range(0, n_clienti, BLOCCO_CLIENTI):
+        n = min(BLOCCO_CLIENTI, n_clienti - inizio)
+        clienti_data = genera_clienti(rng, pool, inizio + 1, n, data_inizio, data_fine)
+        with cronometro(tempi, 'clienti'):
+            cursor.executemany(
+                "INSERT INTO clienti VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                clienti_data
+            )
+        if n_clienti > BLOCCO_CLIENTI:
+            print_progress("Generati clienti...", inizio + n, n_clienti)
     
-    cursor.executemany(
-        "INSERT INTO clienti VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        clienti_data
-    )
     print_progress(f"✓ Inseriti {n_clienti:,} clienti")
 
 
-def populate_ordini(cursor, n_ordini, n_clienti, n_prodotti):
-    """Popola le tabelle ordini, dettagli_ordini, spedizioni e pagamenti."""
-    print_progress(f"Popolamento {n_ordini:,} ordini e transazioni...")
-    
-    ordini_data = []
-    dettagli_data = []
-    spedizioni_data = []
-    pagamenti_data = []
-    
-    stati_ordine = ['Completato', 'In Elaborazione', 'Spedito', 'Consegnato', 'Cancellato']
-    pesi_stati = [0.7, 0.05, 0.1, 0.12, 0.03]
-    canali = ['Web', 'Mobile App', 'Telefono']
-    pesi_canali = [0.6, 0.35, 0.05]
-    corrieri = ['DHL', 'UPS', 'FedEx', 'Poste Italiane', 'BRT']
-    metodi_pagamento = ['Carta di Credito', 'PayPal', 'Bonifico', 'Contrassegno']
-    pesi_pagamento = [0.5, 0.3, 0.1, 0.1]
-    
-    data_inizio = datetime.now() - timedelta(days=730)
-    data_fine = datetime.now()
-    
+def scegli(rng, valori, pesi, n):
+    """n estrazioni da valori con i pesi dati (array numpy)."""
+    p = np.asarray(pesi, dtype=np.float64)
+    return np.asarray(valori)[rng.choice(len(valori), size=n, p=p / p.sum())]
+
+
+def prodotti_distinti(rng, n, k_max, n_prodotti):
+    """
+    Per ognuna delle n righe, k_max prodotti distinti in ordine casuale
+    (come random.sample): la j-esima estrazione sceglie tra i prodotti
+    rimasti e si sposta oltre quelli già presi, una colonna alla volta.
+    """
+    scelti = np.empty((n, k_max), dtype=np.int64)
+    for j in range(k_max):
+        valore = rng.integers(0, n_prodotti - j, size=n)
+        for precedente in np.sort(scelti[:, :j], axis=1).T:
+            valore += valore >= precedente
+        scelti[:, j] = valore
+    return scelti + 1
+
+
+def date_sql(valori, unit='s'):
+    """datetime64 -> stringhe 'YYYY-MM-DD HH:MM:SS' (o 'YYYY-MM-DD'), NaT -> None."""
+    testo = np.datetime_as_string(valori, unit=unit)
+    if unit == 's':
+        testo = np.char.replace(testo, 'T', ' ')
+    testo = testo.astype(object)
+    testo[np.isnat(valori)] = None
+    return testo
+
+
+def genera_ordini(rng, primo_ordine_id, n_ordini, primo_dettaglio_id, n_clienti,
+                  prezzi_prodotti, data_inizio, data_fine):
+    """
+    Genera un blocco di ordini consecutivi con array numpy (distribuzioni
+    di STATI_ORDINE, CANALI, N_RIGHE, ...), nessun loop Python per ordine.
+    Ritorna le righe (liste di tuple) di ordini, dettagli_ordini,
+    spedizioni e pagamenti.
+    """
+    n_prodotti = len(prezzi_prodotti)
+    ordine_id = np.arange(primo_ordine_id, primo_ordine_id + n_ordini)
+    
+    # Ordini
+    cliente_id = rng.integers(1, n_clienti + 1, size=n_ordini)
+    inizio = np.datetime64(data_inizio, 's')
+    durata = int((np.datetime64(data_fine, 's') - inizio).astype(np.int64))
+    data_ordine = inizio + rng.integers(0, durata + 1, size=n_ordini).astype('timedelta64[s]')
+    stato = scegli(rng, STATI_ORDINE, PESI_STATI, n_ordini)
+    canale = scegli(rng, CANALI, PESI_CANALI, n_ordini)
+    
+    # Dettagli: n righe per ordine, prodotti distinti nello stesso ordine
+    n_righe = scegli(rng, N_RIGHE, PESI_N_RIGHE, n_ordini)
+    prodotti = prodotti_distinti(rng, n_ordini, max(N_RIGHE), n_prodotti)
+    presente = np.arange(max(N_RIGHE)) < n_righe[:, None]
+    prodotto_id = prodotti[presente]
+    riga_ordine = np.repeat(ordine_id, n_righe)
+    n_dettagli = len(prodotto_id)
+    quantita = scegli(rng, QUANTITA, PESI_QUANTITA, n_dettagli)
+    sconto = scegli(rng, SCONTI, PESI_SCONTI, n_dettagli)
+    prezzo = prezzi_prodotti[prodotto_id - 1]
+    
+    # importo_totale: somma segmentata delle righe di ogni ordine
+    inizio_righe = np.concatenate([[0], np.cumsum(n_righe)[:-1]])
+    importo_totale = np.add.reduceat(quantita * prezzo * (1 - sconto / 100), inizio_righe)
+    
+    # Spedizioni (non per gli ordini cancellati)
+    spedito = stato != 'Cancellato'
+    giorni_spedizione = rng.integers(1, 4, size=n_ordini).astype('timedelta64[D]')
+    giorni_consegna = rng.integers(2, 8, size=n_ordini).astype('timedelta64[D]')
+    data_spedizione = data_ordine.astype('datetime64[D]') + giorni_spedizione
+    data_consegna = np.where(stato == 'Consegnato', data_spedizione + giorni_consegna,
+                             np.datetime64('NaT', 'D'))
+    corriere = np.asarray(CORRIERI)[rng.integers(0, len(CORRIERI), size=n_ordini)]
+    costo_spedizione = np.asarray(COSTI_SPEDIZIONE)[rng.integers(0, len(COSTI_SPEDIZIONE), size=n_ordini)]
+    
+    # Pagamenti
+    metodo = scegli(rng, METODI_PAGAMENTO, PESI_PAGAMENTO, n_ordini)
+    minuti = rng.integers(1, 31, size=n_ordini).astype('timedelta64[m]')
+    data_pagamento = data_ordine + minuti
+    stato_pagamento = np.where(spedito, 'Completato', 'Rimborsato')
+    
+    ordini = list(zip(ordine_id.tolist(), cliente_id.tolist(), date_sql(data_ordine).tolist(),
+                      stato.tolist(), canale.tolist()))
+    dettagli = list(zip(range(primo_dettaglio_id, primo_dettaglio_id + n_dettagli),
+                        riga_ordine.tolist(), prodotto_id.tolist(), quantita.tolist(),
+                        prezzo.tolist(), sconto.tolist()))
+    spedizioni = list(zip(ordine_id[spedito].tolist(), ordine_id[spedito].tolist(),
+                          date_sql(data_spedizione[spedito], 'D').tolist(),
+                          date_sql(data_consegna[spedito], 'D').tolist(),
+                          corriere[spedito].tolist(), costo_spedizione[spedito].tolist()))
+    pagamenti = list(zip(ordine_id.tolist(), ordine_id.tolist(), metodo.tolist(),
+                         importo_totale.tolist(), date_sql(data_pagamento).tolist(),
+                         stato_pagamento.tolist()))
+    return ordini, dettagli, spedizioni, pagamenti
+
+
+INSERT_ORDINI = {
+    'ordini': "INSERT INTO ordini VALUES (?, ?, ?, ?, ?)",
+    'dettagli_ordini': "INSERT INTO dettagli_ordini VALUES (?, ?, ?, ?, ?, ?)",
+    'spedizioni': "INSERT INTO spedizioni VALUES (?, ?, ?, ?, ?, ?)",
+    'pagamenti': "INSERT INTO pagamenti VALUES (?, ?, ?, ?, ?, ?)",
+}
+
+
+def genera_blocchi(rng, primo_ordine_id, n_ordini, n_clienti, prezzi_prodotti,
+                   data_inizio, data_fine, blocco=BLOCCO_ORDINI):
+    """
+    Generatore: righe (ordini, dettagli, spedizioni, pagamenti) di al più
+    `blocco` ordini alla volta, con dettaglio_id consecutivi da 1.
+    """
     dettaglio_id = 1
-    
-    # Prezzi prodotti (per velocità)
-    prezzi_prodotti = {i: random.uniform(50, 1500) for i in range(1, n_prodotti + 1)}
-    
-    for ordine_id in range(1, n_ordini + 1):
-        # Ordine
-        cliente_id = random.randint(1, n_clienti)
-        data_ordine = fake.date_time_between(start_date=data_inizio, end_date=data_fine)
-        stato = random.choices(stati_ordine, weights=pesi_stati)[0]
-        canale = random.choices(canali, weights=pesi_canali)[0]
-        
-        ordini_data.append((ordine_id, cliente_id, data_ordine, stato, canale))
-        
-        # Dettagli ordine
-        n_prodotti_ordine = random.choices([1, 2, 3, 4, 5], weights=[0.4, 0.3, 0.2, 0.07, 0.03])[0]
-        prodotti_ordine = random.sample(range(1, n_prodotti + 1), n_prodotti_ordine)
-        
-        importo_totale = 0
-        
-        for prodotto_id in prodotti_ordine:
-            quantita = random.choices([1, 2, 3], weights=[0.8, 0.15, 0.05])[0]
-            prezzo = prezzi_prodotti[prodotto_id]
-            sconto = random.choices([0, 5, 10, 15, 20], weights=[0.6, 0.2, 0.1, 0.07, 0.03])[0]
-            
-            dettagli_data.append((
-                dettaglio_id, ordine_id, prodotto_id, quantita, prezzo, sconto
-            ))
-            
-            importo_totale += quantita * prezzo * (1 - sconto/100)
-            dettaglio_id += 1
-        
-        # Spedizione
-        if stato != 'Cancellato':
-            data_spedizione = data_ordine + timedelta(days=random.randint(1, 3))
-            data_consegna = data_spedizione + timedelta(days=random.randint(2, 7)) if stato == 'Consegnato' else None
-            corriere = random.choice(corrieri)
-            costo_spedizione = random.choice([0, 4.99, 9.99])
-            
-            spedizioni_data.append((
-                ordine_id, ordine_id, data_spedizione.date(),
-                data_consegna.date() if data_consegna else None,
-                corriere, costo_spedizione
-            ))
-        
-        # Pagamento
-        metodo = random.choices(metodi_pagamento, weights=pesi_pagamento)[0]
-        data_pagamento = data_ordine + timedelta(minutes=random.randint(1, 30))
-        stato_pagamento = 'Completato' if stato != 'Cancellato' else 'Rimborsato'
-        
-        pagamenti_data.append((
-            ordine_id, ordine_id, metodo, importo_totale, data_pagamento, stato_pagamento
-        ))
+    for inizio in range(0, n_ordini, blocco):
+        righe = genera_ordini(rng, primo_ordine_id + inizio, min(blocco, n_ordini - inizio),
+                              dettaglio_id, n_clienti, prezzi_prodotti, data_inizio, data_fine)
+        dettaglio_id += len(righe[1])
+        yield righe
+
+
+def inserisci_blocchi(conn, blocchi, n_ordini, progress=print_progress, commit=True, tempi=None):
+    """
+    Inserisce i blocchi man mano che vengono generati: un executemany per
+    tabella e una transazione per blocco (commit=False: tutto nella
+    transazione del chiamante). progress(messaggio, step, totale) viene
+    chiamata dopo ogni blocco (None = nessun output).
+    Ritorna il numero di righe di dettaglio.
+    """
+    n_fatti = n_dettagli = 0
+    for righe in blocchi:
+        for (tabella, sql), valori in zip(INSERT_ORDINI.items(), righe):
+            with cronometro(tempi, tabella):
+                conn.executemany(sql, valori)
+        if commit:
+            with cronometro(tempi, 'commit'):
+                conn.commit()
+        n_fatti += len(righe[0])
+        n_dettagli += len(righe[1])
+        if progress is not None:
+            progress("Inseriti ordini...", n_fatti, n_ordini)
+    return n_dettagli
+
+
+def populate_ordini_numpy(cursor, n_ordini, n_clienti, n_prodotti, seed=SEED, data_fine=None,
+                          progress=print_progress, commit=True, tempi=None):
+    """
+    Popola ordini, dettagli_ordini, spedizioni e pagamenti generando gli
+    ordini con NumPy (genera_ordini) a blocchi di BLOCCO_ORDINI, inseriti
+    subito: stesso SEED -> stessi dati.
+    data_fine (default: DATA_RIFERIMENTO) fissa la finestra di 730 giorni.
+    commit=False lascia tutto nella transazione aperta dal chiamante.
+    """
+    print_progress(f"Popolamento {n_ordini:,} ordini e transazioni (NumPy)...")
+    
+    rng = np.random.default_rng(seed)
+    if data_fine is None:
+        data_fine = DATA_RIFERIMENTO
+    data_inizio = data_fine - timedelta(days=730)
+    
+    # Prezzi prodotti
+    prezzi_prodotti = rng.uniform(50, 1500, size=n_prodotti)
+    
+    if commit:
+        cursor.connection.commit()
+    blocchi = genera_blocchi(rng, 1, n_ordini, n_clienti, prezzi_prodotti, data_inizio, data_fine)
+    n_dettagli = inserisci_blocchi(cursor.connection, blocchi, n_ordini, progress, commit, tempi)
+    
+    print_progress(f"✓ Inseriti {n_ordini:,} ordini con {n_dettagli:,} righe")
+
+
+# Tabelle dei file shard: stesse colonne di create_tables, senza vincoli
+SHARD_SQL = """
+CREATE TABLE ordini (ordine_id INTEGER, cliente_id INTEGER, data_ordine DATETIME,
+                     stato VARCHAR(20), canale VARCHAR(20));
+CREATE TABLE dettagli_ordini (dettaglio_id INTEGER, ordine_id INTEGER, prodotto_id INTEGER,
+                              quantita INTEGER, prezzo_unitario DECIMAL(10,2), sconto DECIMAL(5,2));
+CREATE TABLE spedizioni (spedizione_id INTEGER, ordine_id INTEGER, data_spedizione DATE,
+                         data_consegna DATE, corriere VARCHAR(50), costo_spedizione DECIMAL(10,2));
+CREATE TABLE pagamenti (pagamento_id INTEGER, ordine_id INTEGER, metodo_pagamento VARCHAR(50),
+                        importo DECIMAL(10,2), data_pagamento DATETIME, stato_pagamento VARCHAR(20));
+"""
+
+
+def intervalli_shard(n_ordini, n_shard):
+    """(primo_ordine_id, n_ordini) di ogni shard: intervalli contigui e bilanciati."""
+    confini = np.linspace(0, n_ordini, n_shard + 1).astype(np.int64)
+    return [(int(a) + 1, int(b - a)) for a, b in zip(confini[:-1], confini[1:])]
+
+
+def genera_shard(path, seed_seq, primo_ordine_id, n_ordini, n_clienti, prezzi_prodotti,
+                 data_inizio, data_fine):
+    """
+    Processo worker: genera gli ordini del proprio intervallo a blocchi e li
+    scrive in un database SQLite a parte (dettaglio_id locali, da 1). Ritorna
+    (righe di dettaglio, secondi impiegati).
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed_seq)
+    blocchi = genera_blocchi(rng, primo_ordine_id, n_ordini, n_clienti, prezzi_prodotti,
+                             data_inizio, data_fine)
+    
+    conn = sqlite3.connect(path)
+    conn.executescript(SHARD_SQL)
+    n_dettagli = inserisci_blocchi(conn, blocchi, n_ordini, progress=None)
+    conn.close()
+    return n_dettagli, time.perf_counter() - t0
+
+
+def unisci_shard(cursor, path, offset_dettagli, tempi=None, alias='shard', commit=True):
+    """
+    Copia uno shard nel database principale, spostando i dettaglio_id di
+    offset_dettagli. commit=False: niente commit e lo shard resta in ATTACH
+    come `alias` (DETACH non è permesso dentro una transazione aperta).
+    """
+    if commit:
+        cursor.connection.commit()
+    cursor.execute(f"ATTACH DATABASE ? AS {alias}", (str(path),))
+    with cronometro(tempi, 'ordini'):
+        cursor.execute(f"INSERT INTO ordini SELECT * FROM {alias}.ordini ORDER BY ordine_id")
+    with cronometro(tempi, 'dettagli_ordini'):
+        cursor.execute(
+            f"""
+            INSERT INTO dettagli_ordini
+            SELECT dettaglio_id + ?, ordine_id, prodotto_id, quantita, prezzo_unitario, sconto
+            FROM {alias}.dettagli_ordini ORDER BY dettaglio_id
+            """,
+            (offset_dettagli,),
+        )
+    with cronometro(tempi, 'spedizioni'):
+        cursor.execute(f"INSERT INTO spedizioni SELECT * FROM {alias}.spedizioni ORDER BY spedizione_id")
+    with cronometro(tempi, 'pagamenti'):
+        cursor.execute(f"INSERT INTO pagamenti SELECT * FROM {alias}.pagamenti ORDER BY pagamento_id")
+    if commit:
+        with cronometro(tempi, 'commit'):
+            cursor.connection.commit()
+        cursor.execute(f"DETACH DATABASE {alias}")
+
+
+def populate_ordini_shard(cursor, n_ordini, n_clienti, n_prodotti, seed=SEED, n_shard=N_SHARD,
+                          n_processi=N_PROCESSI, data_fine=None, progress=print_progress, tempi=None,
+                          commit=True):
+    """
+    Come populate_ordini_numpy, ma con n_shard intervalli di ordine_id
+    generati da n_processi processi in parallelo. Ogni shard usa il seed
+    SeedSequence(seed).spawn(n_shard)[shard] e scrive un suo file SQLite;
+    gli shard vengono poi uniti in ordine, con dettaglio_id consecutivi.
+    progress(messaggio, step, totale) riceve l'avanzamento dell'unione.
+    commit=False: l'unione resta nella transazione aperta dal chiamante, che
+    viene chiusa con un solo commit alla fine (prima dei DETACH).
+    """
+    if not commit and n_shard > MAX_SHARD_ATTACH:
+        raise ValueError(f"al più {MAX_SHARD_ATTACH} shard in una sola transazione, "
+                         f"richiesti {n_shard}")
+    print_progress(f"Popolamento {n_ordini:,} ordini in {n_shard} shard "
+                   f"({n_processi} processi)...")
+    
+    if data_fine is None:
+        data_fine = DATA_RIFERIMENTO
+    data_inizio = data_fine - timedelta(days=730)
+    
+    # Prezzi condivisi da tutti gli shard: dipendono solo dal seed
+    prezzi_prodotti = np.random.default_rng(seed).uniform(50, 1500, size=n_prodotti)
+    seeds = np.random.SeedSequence(seed).spawn(n_shard)
+    
+    cartella = Path(DB_PATH).resolve().parent
+    with tempfile.TemporaryDirectory(prefix="techstore_shard_", dir=cartella) as tmp:
+        paths = [Path(tmp) / f"shard_{i:03d}.db" for i in range(n_shard)]
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=n_processi) as executor:
+            futures = [
+                executor.submit(genera_shard, path, seed_seq, primo, n, n_clienti,
+                                prezzi_prodotti, data_inizio, data_fine)
+                for path, seed_seq, (primo, n) in zip(paths, seeds, intervalli_shard(n_ordini, n_shard))
+            ]
+            risultati = [f.result() for f in futures]
+        print_progress(f"  ✓ Shard generati in {time.perf_counter() - t0:.2f}s")
         
-        if ordine_id % 20000 == 0:
-            print_progress(f"Generati ordini...", ordine_id, n_ordini)
-    
-    # Inserimento batch
-    print_progress("Inserimento dati nel database...")
-    
-    cursor.executemany("INSERT INTO ordini VALUES (?, ?, ?, ?, ?)", ordini_data)
-    print_progress("  ✓ Ordini inseriti")
-    
-    cursor.executemany("INSERT INTO dettagli_ordini VALUES (?, ?, ?, ?, ?, ?)", dettagli_data)
-    print_progress("  ✓ Dettagli ordini inseriti")
+        print_progress("Unione shard nel database...")
+        offset = 0
+        alias = []
+        for i, (path, (n_dettagli, secondi)) in enumerate(zip(paths, risultati), start=1):
+            alias.append('shard' if commit else f'shard_{i:03d}')
+            unisci_shard(cursor, path, offset, tempi, alias[-1], commit)
+            offset += n_dettagli
+            if progress is not None:
+                progress(f"Shard unito ({secondi:.2f}s di generazione)", i, n_shard)
+        if not commit:
+            with cronometro(tempi, 'commit'):
+                cursor.connection.commit()
+            for nome in alias:
+                cursor.execute(f"DETACH DATABASE {nome}")
+    
+    print_progress(f"✓ Inseriti {n_ordini:,} ordini con {offset:,} righe")
+
+
+def crea_database(conn, n_clienti, n_ordini, bulk=False, journal='OFF', shard=True, tempi=None,
+                  data_fine=None):
+    """
+    Crea e popola il database; in tempi i secondi per tabella e per fase.
+    
+    Profilo standard: indici creati con le tabelle, un commit per tabella e
+    per blocco/shard, journal e synchronous di default.
+    Profilo bulk: journal OFF (o WAL) e synchronous OFF, tabelle senza indici
+    secondari, tutto il caricamento in una transazione, poi INDICI.
+    I due profili caricano gli stessi dati: cambia solo come vengono scritti.
+    data_fine (default: DATA_RIFERIMENTO) è la data di riferimento di clienti e ordini.
+    In entrambi i casi si chiude con ANALYZE e check_integrity.
+    Ritorna il numero di prodotti.
+    """
+    cursor = conn.cursor()
+    if bulk:
+        conn.execute(f"PRAGMA journal_mode = {journal}")
+        set_pragmas(conn, PRAGMA_BULK)
+    
+    create_tables(cursor, indici=not bulk)
+    conn.commit()
+    
+    if bulk:
+        cursor.execute("BEGIN")
+    populate_categorie(cursor, tempi)
+    n_prodotti = populate_prodotti(cursor, tempi)
+    populate_clienti_pool(cursor, n_clienti, data_fine=data_fine, tempi=tempi)
+    if not bulk:
+        with cronometro(tempi, 'commit'):
+            conn.commit()
+    
+    if shard:
+        populate_ordini_shard(cursor, n_ordini, n_clienti, n_prodotti, data_fine=data_fine,
+                              tempi=tempi, commit=not bulk)
+    else:
+        populate_ordini_numpy(cursor, n_ordini, n_clienti, n_prodotti, data_fine=data_fine,
+                              commit=not bulk, tempi=tempi)
+    with cronometro(tempi, 'commit'):
+        conn.commit()
     
-    cursor.executemany("INSERT INTO spedizioni VALUES (?, ?, ?, ?, ?, ?)", spedizioni_data)
-    print_progress("  ✓ Spedizioni inserite")
+    if bulk:
+        print_progress("Creazione indici...")
+        with cronometro(tempi, 'indici'):
+            create_indexes(cursor)
+            conn.commit()
+        set_pragmas(conn, PRAGMA_STANDARD)
     
-    cursor.executemany("INSERT INTO pagamenti VALUES (?, ?, ?, ?, ?, ?)", pagamenti_data)
-    print_progress("  ✓ Pagamenti inseriti")
+    print_progress("ANALYZE e controllo integrità...")
+    with cronometro(tempi, 'ANALYZE'):
+        cursor.execute("ANALYZE")
+        conn.commit()
+    with cronometro(tempi, 'integrity_check'):
+        check_integrity(cursor)
+    print_progress("✓ Integrità verificata")
     
-    print_progress(f"✓ Inseriti {n_ordini:,} ordini con {len(dettagli_data):,} righe")
+    return n_prodotti
+
+
+def stampa_tempi(risultati):
+    """Secondi per tabella/fase, una colonna per profilo ({profilo: tempi})."""
+    profili = list(risultati)
+    voci = list(dict.fromkeys(v for tempi in risultati.values() for v in tempi if v != 'totale'))
+    print(f"  {'tabella/fase':<18}" + "".join(f"{p:>12}" for p in profili))
+    for voce in voci + ['totale']:
+        celle = [f"{risultati[p][voce]:>11.2f}s" if voce in risultati[p] else f"{'-':>12}"
+                 for p in profili]
+        print(f"  {voce:<18}" + "".join(celle))
+
+
+def confronta_profili(n_clienti, n_ordini, journal='OFF', data_fine=None):
+    """
+    Costruisce due database temporanei con gli stessi dati (stesso seed)
+    con il profilo standard e con quello bulk, e stampa i tempi per
+    tabella affiancati.
+    """
+    cartella = Path(DB_PATH).resolve().parent
+    risultati = {}
+    with tempfile.TemporaryDirectory(prefix="techstore_profili_", dir=cartella) as tmp:
+        for profilo, bulk in (('standard', False), ('bulk', True)):
+            print_progress(f"Profilo {profilo}...")
+            random.seed(SEED)
+            tempi = {}
+            conn = sqlite3.connect(Path(tmp) / f"{profilo}.db")
+            t0 = time.perf_counter()
+            crea_database(conn, n_clienti, n_ordini, bulk=bulk, journal=journal, tempi=tempi,
+                          data_fine=data_fine)
+            tempi['totale'] = time.perf_counter() - t0
+            conn.close()
+            risultati[profilo] = tempi
+            print()
+    
+    print("Tempi di caricamento (totale = generazione compresa):")
+    stampa_tempi(risultati)
+    return risultati
+
+
+def dimensioni_attese(scale_factor=1.0):
+    """
+    Righe attese per tabella con lo scale factor dato: clienti e ordini
+    esatti, le altre come valore atteso delle distribuzioni degli ordini.
+    Categorie e prodotti non scalano.
+    """
+    n_clienti = max(1, round(N_CLIENTI * scale_factor))
+    n_ordini = max(1, round(N_ORDINI * scale_factor))
+    righe_per_ordine = np.dot(N_RIGHE, PESI_N_RIGHE) / np.sum(PESI_N_RIGHE)
+    p_cancellato = PESI_STATI[STATI_ORDINE.index('Cancellato')] / np.sum(PESI_STATI)
+    return {
+        'clienti': n_clienti,
+        'ordini': n_ordini,
+        'dettagli_ordini': round(n_ordini * righe_per_ordine),
+        'spedizioni': round(n_ordini * (1 - p_cancellato)),
+        'pagamenti': n_ordini,
+    }
 
 
 def main():
     """Funzione principale."""
+    parser = argparse.ArgumentParser(description="Setup database OLTP TechStore")
+    parser.add_argument('--bulk', action='store_true',
+                        help="profilo bulk: journal/sync rilassati, indici dopo il caricamento")
+    parser.add_argument('--journal', choices=[j.lower() for j in JOURNAL_BULK], default='off',
+                        help="journal_mode durante il caricamento bulk")
+    parser.add_argument('--confronta', action='store_true',
+                        help="confronta i tempi per tabella con e senza profilo bulk")
+    parser.add_argument('--scale-factor', type=float, default=1.0,
+                        help=f"SF1 = {N_CLIENTI:,} clienti e {N_ORDINI:,} ordini")
+    parser.add_argument('--data-riferimento', type=datetime.fromisoformat, default=DATA_RIFERIMENTO,
+                        help=f"fine della finestra di clienti e ordini, AAAA-MM-GG "
+                             f"(default {DATA_RIFERIMENTO:%Y-%m-%d})")
+    args = parser.parse_args()
+    if args.scale_factor <= 0:
+        parser.error("--scale-factor deve essere > 0")
+    journal = args.journal.upper()
+    attese = dimensioni_attese(args.scale_factor)
+    n_clienti, n_ordini = attese['clienti'], attese['ordini']
+    
     print("=" * 70)
     print("SETUP DATABASE OLTP - TechStore E-commerce")
     print("=" * 70)
     print()
+    print(f"Dimensioni attese (SF{args.scale_factor:g}):")
+    for tabella, righe in attese.items():
+        print(f"  - {tabella:<16} ~{righe:>14,}")
+    print(f"Data di riferimento: {args.data_riferimento:%Y-%m-%d} (seed {SEED})")
+    print()
     
     try:
+        if args.confronta:
+            confronta_profili(n_clienti, n_ordini, journal, args.data_riferimento)
+            return
+        
         # Connessione database
         print_progress(f"Creazione database: {DB_PATH}")
         conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
         
-        # Creazione tabelle
-        create_tables(cursor)
-        conn.commit()
-        
-        # Popolamento
-        populate_categorie(cursor)
-        conn.commit()
-        
-        n_prodotti = populate_prodotti(cursor)
-        conn.commit()
-        
-        populate_clienti(cursor, N_CLIENTI)
-        conn.commit()
-        
-        populate_ordini(cursor, N_ORDINI, N_CLIENTI, n_prodotti)
-        conn.commit()
+        # Creazione tabelle e popolamento
+        tempi = {}
+        t0 = time.perf_counter()
+        n_prodotti = crea_database(conn, n_clienti, n_ordini, bulk=args.bulk, journal=journal,
+                                   tempi=tempi, data_fine=args.data_riferimento)
+        tempi['totale'] = time.perf_counter() - t0
         
         # Statistiche finali
         print()
@@ -409,10 +930,14 @@ def main():
         print("Statistiche:")
         print(f"  - Categorie:       8")
         print(f"  - Prodotti:        {n_prodotti}")
-        print(f"  - Clienti:         {N_CLIENTI:,}")
-        print(f"  - Ordini:          {N_ORDINI:,}")
+        print(f"  - Clienti:         {n_clienti:,}")
+        print(f"  - Ordini:          {n_ordini:,}")
+        print(f"  - Riferimento:     {args.data_riferimento:%Y-%m-%d}")
         print(f"  - Database:        {DB_PATH}")
         print()
+        print("Tempi di caricamento:")
+        stampa_tempi({'bulk' if args.bulk else 'standard': tempi})
+        print()
         print("Prossimo passo: esegui 02_esplora_oltp.py")
         print()
         
@@ -426,4 +951,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
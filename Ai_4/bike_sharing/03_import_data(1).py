@@ -5,12 +5,17 @@ Parte 1: Import dei Dati CSV nel Database PostgreSQL
 Questo script importa i file CSV del dataset reale nel database OLTP.
 """
 
-import random
+import argparse
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import psycopg
 
+from geo_utils import epoch_to_utc, haversine_m, local_times
+
 
 # =============================================================================
 # CONFIG
@@ -26,6 +31,42 @@ DB_CONFIG = {
 
 DATA_DIR = Path("/home/Ai/Ai_2_Ai_4/Ai_4/bike_sharing/data")
 
+# True = i CSV vengono letti dalla cache Parquet tipizzata (staging_cache.py),
+# ricostruita in automatico quando il CSV cambia
+USE_STAGING = False
+
+# Colonne di trips.csv caricate via COPY, con il tipo PostgreSQL usato per il dump.
+# Gli id sono letti da pandas come float64 (per via dei NaN): vanno riportati a
+# interi nullable, altrimenti COPY riceverebbe "2204.0" per una colonna intera.
+TRIPS_COPY_COLUMNS = {
+    "bike_id": "int8",
+    "city_id": "int8",
+    "time_start": "float8",
+    "lon_start": "float8",
+    "lat_start": "float8",
+    "lon_end": "float8",
+    "lat_end": "float8",
+    "station_id_start": "int8",
+    "station_id_end": "int8",
+    "battery_start": "float8",
+    "battery_end": "float8",
+    "duration": "float8",
+    "distance": "float8",
+}
+
+# Validazione trips: oltre queste soglie il trip va in trips_quarantine
+MAX_TRIP_DISTANCE_M = 50_000      # "teletrasporto" tra partenza e arrivo
+MAX_SPEED_KMH = 45.0              # oltre il limite di e-bike/monopattini
+DISTANCE_TOLERANCE_M = 50.0       # scarto ammesso tra distance e haversine...
+DISTANCE_TOLERANCE_RATIO = 0.05   # ...più il 5% della distanza calcolata
+
+# Colonne aggiunte da validate_trips, con il tipo per la COPY in trips_quarantine
+QUARANTINE_CHECK_COLUMNS = {
+    "haversine_m": "float8",
+    "speed_kmh": "float8",
+    "reason": "text",
+}
+
 
 # =============================================================================
 # HELPERS
@@ -50,221 +91,572 @@ def assert_csv_exists(filename: str) -> Path:
     return p
 
 
+def read_csv_chunks(filename: str, chunksize=None, skip_rows=0, dtype=None):
+    """
+    Legge un CSV di DATA_DIR come sequenza di DataFrame.
+    chunksize=None -> un solo DataFrame con tutto il file (sample da 1000 righe);
+    altrimenti blocchi da chunksize righe, così la memoria dipende dal chunk
+    e non dalla dimensione del file (dataset completo da 2.3 GB).
+    skip_rows salta le prime N righe di dati (l'header resta).
+    dtype viene passato a pd.read_csv (colonne text lette come stringhe).
+    Con USE_STAGING i blocchi arrivano dal Parquet di data/staging, con
+    time_start riportato a epoch float come nel CSV.
+    """
+    path = assert_csv_exists(filename)
+    if USE_STAGING:
+        from staging_cache import read_staged_chunks
+        yield from read_staged_chunks(filename, chunksize, skip_rows, data_dir=DATA_DIR, as_epoch=True)
+        return
+    skiprows = range(1, skip_rows + 1) if skip_rows else None
+    if chunksize is None:
+        yield pd.read_csv(path, skiprows=skiprows, dtype=dtype)
+    else:
+        yield from pd.read_csv(path, skiprows=skiprows, chunksize=chunksize, dtype=dtype)
+
+
+def nullable_list(s: pd.Series) -> list:
+    """
+    Colonna -> lista Python: NaN/NA -> None, valori Python nativi.
+    Stessa semantica di py_value, ma applicata a tutta la colonna.
+    """
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def copy_rows(df: pd.DataFrame):
+    """Righe di df pronte per COPY (vedi nullable_list)."""
+    return zip(*(nullable_list(df[c]) for c in df.columns))
+
+
+def copy_frame(cur, table: str, df: pd.DataFrame, types):
+    """COPY di tutte le righe di df in table (colonne = colonne di df)."""
+    with cur.copy(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN") as copy:
+        copy.set_types(types)
+        for row in copy_rows(df):
+            copy.write_row(row)
+
+
+# righe formattate per ogni copy.write di copy_frame_csv
+COPY_CSV_BLOCK_ROWS = 100_000
+
+
+def copy_frame_csv(cur, table: str, df: pd.DataFrame, block_rows=COPY_CSV_BLOCK_ROWS):
+    """
+    Come copy_frame, ma il testo del COPY (FORMAT csv) è prodotto da
+    DataFrame.to_csv a blocchi di block_rows righe e inviato con copy.write:
+    niente conversione per valore di write_row. Le colonne devono essere già
+    nel formato testuale di PostgreSQL (date come stringhe ISO); valori
+    mancanti e stringhe vuote arrivano come NULL.
+    """
+    with cur.copy(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN (FORMAT csv)") as copy:
+        for start in range(0, len(df), block_rows):
+            copy.write(df.iloc[start:start + block_rows].to_csv(header=False, index=False))
+
+
 def connect_db():
     return psycopg.connect(**DB_CONFIG)
 
 
-def make_heavy_user_sampler(user_ids, alpha=1.2):
+def build_alias_table(weights):
+    """
+    Tabella alias di Vose per pesi qualsiasi (non normalizzati).
+    Costruzione O(n) una sola volta; ogni estrazione costa poi O(1).
+    """
+    p = np.asarray(weights, dtype=np.float64)
+    n = len(p)
+    scaled = p * (n / p.sum())
+    prob = np.ones(n, dtype=np.float64)
+    alias = np.arange(n, dtype=np.int64)
+
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    # gli avanzi (errori di arrotondamento) restano con prob = 1
+    return prob, alias
+
+
+def make_heavy_user_sampler(user_ids, alpha=1.2, seed=None):
     """
     Ritorna una funzione che estrae user_id con distribuzione "heavy tail":
     pochi utenti fanno tanti viaggi, tanti utenti ne fanno pochi.
     alpha più alto => più concentrazione su pochi utenti.
+
+    La tabella alias è costruita una volta sola: sample() ritorna un id,
+    sample(n) un array numpy di n id estratti in un'unica chiamata vettoriale.
+    Stesso seed => stessa sequenza.
     """
     # ordina per avere ranking stabile
-    ids = list(user_ids)
+    ids = np.asarray(list(user_ids), dtype=np.int64)
     # pesi ~ 1 / rank^alpha
-    weights = [1.0 / ((i + 1) ** alpha) for i in range(len(ids))]
-    def sample_one():
-        return random.choices(ids, weights=weights, k=1)[0]
-    return sample_one
+    weights = 1.0 / np.arange(1, len(ids) + 1, dtype=np.float64) ** alpha
+    prob, alias = build_alias_table(weights)
+    rng = np.random.default_rng(seed)
+
+    def sample(n=None):
+        k = 1 if n is None else n
+        i = rng.integers(0, len(ids), size=k)
+        picked = ids[np.where(rng.random(k) < prob[i], i, alias[i])]
+        return int(picked[0]) if n is None else picked
+    return sample
 
 
 # =============================================================================
-# IMPORT DIMENSIONS
+# SCHEMA
 # =============================================================================
 
-def import_cities(conn):
-    print("Importazione cities...")
-    df = pd.read_csv(assert_csv_exists("cities.csv"))
+# Schema OLTP atteso dall'import (tabelle create solo se mancanti).
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS cities (
+    id                      BIGINT PRIMARY KEY,
+    name                    TEXT,
+    lat                     DOUBLE PRECISION,
+    lon                     DOUBLE PRECISION,
+    timezone                TEXT,
+    country                 TEXT,
+    return_to_official_only BOOLEAN
+);
+
+CREATE TABLE IF NOT EXISTS bike_types (
+    id               BIGINT PRIMARY KEY,
+    vehicle_image    TEXT,
+    name             TEXT,
+    description      TEXT,
+    form_factor      TEXT,
+    rider_capacity   INTEGER,
+    propulsion_type  TEXT,
+    max_range        DOUBLE PRECISION,
+    battery_capacity DOUBLE PRECISION
+);
+
+CREATE TABLE IF NOT EXISTS bikes (
+    id           BIGINT PRIMARY KEY,
+    bike_type_id BIGINT REFERENCES bike_types (id),
+    computer_id  BIGINT
+);
+
+CREATE TABLE IF NOT EXISTS stations (
+    id            BIGINT PRIMARY KEY,
+    city_id       BIGINT REFERENCES cities (id),
+    name          TEXT,
+    app_number    TEXT,
+    terminal_type TEXT,
+    place_type    TEXT,
+    bike_racks    INTEGER,
+    special_racks INTEGER,
+    lon           DOUBLE PRECISION,
+    lat           DOUBLE PRECISION
+);
+
+CREATE TABLE IF NOT EXISTS utenti (
+    id                 BIGSERIAL PRIMARY KEY,
+    bike_id            BIGINT REFERENCES bikes (id),
+    nome               TEXT NOT NULL,
+    cognome            TEXT NOT NULL,
+    email              TEXT UNIQUE NOT NULL,
+    data_nascita       DATE,
+    citta              TEXT,
+    data_registrazione TIMESTAMP,
+    tipo_abbonamento   TEXT,
+    stato              TEXT
+);
+"""
 
-    cur = conn.cursor()
-    try:
-        for _, row in df.iterrows():
-            cur.execute(
-                """
-                INSERT INTO cities (id, name, lat, lon, timezone, country, return_to_official_only)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id) DO NOTHING
-                """,
-                (
-                    py_value(row["id"]),
-                    py_value(row["name"]),
-                    py_value(row["lat"]),
-                    py_value(row["lon"]),
-                    py_value(row["timezone"]),
-                    py_value(row["country"]),
-                    py_value(row.get("return_to_official_only")),
-                ),
-            )
-        conn.commit()
-        print(f"✓ {len(df)} città importate")
-    finally:
-        cur.close()
+# Trips scartati da --validate: stesse colonne di trips + esito dei controlli.
+# Creata da create_schema o, se manca, dal primo import con validazione.
+TRIPS_QUARANTINE_SQL = """
+CREATE TABLE IF NOT EXISTS trips_quarantine (
+    id               BIGSERIAL PRIMARY KEY,
+    bike_id          BIGINT,
+    city_id          BIGINT,
+    time_start       DOUBLE PRECISION,
+    lon_start        DOUBLE PRECISION,
+    lat_start        DOUBLE PRECISION,
+    lon_end          DOUBLE PRECISION,
+    lat_end          DOUBLE PRECISION,
+    station_id_start BIGINT,
+    station_id_end   BIGINT,
+    battery_start    DOUBLE PRECISION,
+    battery_end      DOUBLE PRECISION,
+    duration         DOUBLE PRECISION,
+    distance         DOUBLE PRECISION,
+    user_id          BIGINT,
+    reason           TEXT NOT NULL,
+    haversine_m      DOUBLE PRECISION,
+    speed_kmh        DOUBLE PRECISION,
+    quarantined_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
 
 
-def import_bike_types(conn):
-    print("Importazione bike_types...")
-    df = pd.read_csv(assert_csv_exists("bike_types.csv"))
+TRIPS_COLUMNS_SQL = """
+    bike_id          BIGINT REFERENCES bikes (id),
+    city_id          BIGINT REFERENCES cities (id),
+    time_start       DOUBLE PRECISION,
+    lon_start        DOUBLE PRECISION,
+    lat_start        DOUBLE PRECISION,
+    lon_end          DOUBLE PRECISION,
+    lat_end          DOUBLE PRECISION,
+    station_id_start BIGINT REFERENCES stations (id),
+    station_id_end   BIGINT REFERENCES stations (id),
+    battery_start    DOUBLE PRECISION,
+    battery_end      DOUBLE PRECISION,
+    duration         DOUBLE PRECISION,
+    distance         DOUBLE PRECISION,
+    user_id          BIGINT REFERENCES utenti (id)
+"""
 
-    cur = conn.cursor()
-    try:
-        for _, row in df.iterrows():
-            cur.execute(
-                """
-                INSERT INTO bike_types (id, vehicle_image, name, description, form_factor,
-                                      rider_capacity, propulsion_type, max_range, battery_capacity)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id) DO NOTHING
-                """,
-                (
-                    py_value(row["id"]),
-                    py_value(row.get("vehicle_image")),
-                    py_value(row.get("name")),
-                    py_value(row.get("description")),
-                    py_value(row.get("form_factor")),
-                    py_value(row.get("rider_capacity")),
-                    py_value(row.get("propulsion_type")),
-                    py_value(row.get("max_range")),
-                    py_value(row.get("battery_capacity")),
-                ),
-            )
-        conn.commit()
-        print(f"✓ {len(df)} tipi di bici importati")
-    finally:
-        cur.close()
+TRIPS_SQL = f"""
+CREATE TABLE IF NOT EXISTS trips (
+    id               BIGSERIAL PRIMARY KEY,{TRIPS_COLUMNS_SQL});
+"""
 
+# trips partizionata per mese di time_start (epoch): le query per intervallo
+# di tempo leggono solo le partizioni coinvolte. La PK non c'è perché
+# dovrebbe includere time_start (che può essere NULL -> partizione default).
+TRIPS_PARTITIONED_SQL = f"""
+CREATE TABLE IF NOT EXISTS trips (
+    id               BIGSERIAL,{TRIPS_COLUMNS_SQL}) PARTITION BY RANGE (time_start);
 
-def import_bikes(conn):
-    print("Importazione bikes...")
-    df = pd.read_csv(assert_csv_exists("bikes.csv"))
+CREATE INDEX IF NOT EXISTS trips_time_start_brin ON trips USING brin (time_start);
+CREATE INDEX IF NOT EXISTS trips_id_idx ON trips (id);
+"""
 
-    cur = conn.cursor()
-    try:
-        for _, row in df.iterrows():
+# time_start convertito in fase di import: timestamptz UTC + ora locale della
+# città (fuso da cities.timezone). Gli aggregati orari/giornalieri raggruppano
+# su colonne indicizzate invece di chiamare to_timestamp() a ogni query.
+TRIPS_TIME_SQL = """
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS time_start_utc   TIMESTAMPTZ;
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS time_start_local TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS trips_city_local_idx ON trips (city_id, time_start_local);
+"""
+
+# partizioni hash per city_id dentro ogni mese (modalità "month_city")
+TRIPS_CITY_HASH_PARTITIONS = 8
+
+TRIPS_PARTITIONING = (None, "month", "month_city")
+
+
+def create_trips_partition(cur, name: str, bound_sql: str, by_city: bool):
+    """Crea una partizione di trips (e, se by_city, le sue sottopartizioni hash)."""
+    sub = " PARTITION BY HASH (city_id)" if by_city else ""
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF trips {bound_sql}{sub}")
+    if by_city:
+        for k in range(TRIPS_CITY_HASH_PARTITIONS):
             cur.execute(
-                """
-                INSERT INTO bikes (id, bike_type_id, computer_id)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (id) DO NOTHING
-                """,
-                (
-                    py_value(row["id"]),
-                    py_value(row.get("bike_type_id")),
-                    py_value(row.get("computer_id")),
-                ),
+                f"CREATE TABLE IF NOT EXISTS {name}_c{k} PARTITION OF {name} "
+                f"FOR VALUES WITH (MODULUS {TRIPS_CITY_HASH_PARTITIONS}, REMAINDER {k})"
             )
-        conn.commit()
-        print(f"✓ {len(df)} biciclette importate")
-    finally:
-        cur.close()
 
 
-def import_stations(conn):
-    print("Importazione stations...")
-    df = pd.read_csv(assert_csv_exists("stations.csv"))
+def trips_partitioning(conn):
+    """None se trips non è partizionata, altrimenti "month" o "month_city"."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT t.relkind, d.relkind
+            FROM pg_class t
+            LEFT JOIN pg_class d ON d.relname = 'trips_default'
+            WHERE t.relname = 'trips'
+            """
+        )
+        row = cur.fetchone()
+    if row is None or row[0] != "p":
+        return None
+    return "month_city" if row[1] == "p" else "month"
+
+
+def ensure_trip_partitions(conn, time_start, partitioning):
+    """
+    Crea le partizioni mensili mancanti per gli epoch in time_start, prima
+    del COPY: PostgreSQL instrada poi da solo ogni riga nella partizione
+    giusta (le righe senza time_start finiscono in trips_default).
+    """
+    ts = pd.Series(time_start).dropna().to_numpy(dtype=np.int64)
+    months = np.unique(ts.astype("datetime64[s]").astype("datetime64[M]"))
+    if len(months) == 0:
+        return
+
+    with conn.cursor() as cur:
+        for month in months:
+            lo = int(month.astype("datetime64[s]").astype(np.int64))
+            hi = int((month + 1).astype("datetime64[s]").astype(np.int64))
+            name = f"trips_{str(month).replace('-', '_')}"
+            create_trips_partition(cur, name, f"FOR VALUES FROM ({lo}) TO ({hi})",
+                                   partitioning == "month_city")
+    conn.commit()
+
+
+def create_schema(conn, partitioning=None):
+    """
+    Crea le tabelle mancanti. partitioning = "month" / "month_city" crea
+    trips partizionata (vedi TRIPS_PARTITIONED_SQL) con indice BRIN su time_start.
+    """
+    if partitioning not in TRIPS_PARTITIONING:
+        raise ValueError(f"partitioning non valido: {partitioning}")
+
+    print("Creazione schema (se mancante)...")
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_SQL)
+        cur.execute(TRIPS_QUARANTINE_SQL)
+        if partitioning is None:
+            cur.execute(TRIPS_SQL)
+        else:
+            cur.execute(TRIPS_PARTITIONED_SQL)
+            create_trips_partition(cur, "trips_default", "DEFAULT", partitioning == "month_city")
+        cur.execute(TRIPS_TIME_SQL)
+    conn.commit()
+    print(f"✓ Schema pronto (trips: {partitioning or 'non partizionata'})")
+
+
+# =============================================================================
+# IMPORT DIMENSIONS
+# =============================================================================
+
+# colonne caricate per ogni dimensione, con il tipo PostgreSQL usato per COPY
+DIMENSION_COLUMNS = {
+    "cities": {
+        "id": "int8",
+        "name": "text",
+        "lat": "float8",
+        "lon": "float8",
+        "timezone": "text",
+        "country": "text",
+        "return_to_official_only": "bool",
+    },
+    "bike_types": {
+        "id": "int8",
+        "vehicle_image": "text",
+        "name": "text",
+        "description": "text",
+        "form_factor": "text",
+        "rider_capacity": "int4",
+        "propulsion_type": "text",
+        "max_range": "float8",
+        "battery_capacity": "float8",
+    },
+    "bikes": {
+        "id": "int8",
+        "bike_type_id": "int8",
+        "computer_id": "int8",
+    },
+    "stations": {
+        "id": "int8",
+        "city_id": "int8",
+        "name": "text",
+        "app_number": "text",
+        "terminal_type": "text",
+        "place_type": "text",
+        "bike_racks": "int4",
+        "special_racks": "int4",
+        "lon": "float8",
+        "lat": "float8",
+    },
+}
+
+PANDAS_COPY_DTYPES = {
+    "int8": "Int64",
+    "int4": "Int64",
+    "float8": "float64",
+    "text": "string",
+    "bool": "boolean",
+}
+
+
+def csv_dtypes(columns: dict) -> dict:
+    """dtype per read_csv_chunks: colonne text e bool lette già col tipo di COPY."""
+    return {col: PANDAS_COPY_DTYPES[t] for col, t in columns.items() if t in ("text", "bool")}
+
 
+def dimension_frame(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """
+    Colonne della dimensione con il dtype pandas giusto per COPY: i valori
+    di una colonna text devono arrivare come str anche se il CSV ha numeri
+    (app_number, place_type): vanno lette con csv_dtypes, altrimenti pandas
+    le fa float64 e 56000 diventerebbe "56000.0". Colonne assenti dal CSV -> NULL.
+    """
+    out = pd.DataFrame(index=df.index)
+    for col, pg_type in columns.items():
+        dtype = PANDAS_COPY_DTYPES[pg_type]
+        if col not in df.columns:
+            out[col] = pd.Series(pd.NA, index=df.index, dtype=dtype)
+        elif dtype in ("string", "boolean"):
+            out[col] = df[col].astype(dtype)
+        else:
+            out[col] = pd.to_numeric(df[col]).astype(dtype)
+    return out
+
+
+def upsert_dimension(cur, table: str, df: pd.DataFrame, columns: dict, key="id"):
+    """
+    COPY di df nella tabella di staging {table}_staging (UNLOGGED, svuotata
+    prima) e un solo INSERT ... SELECT ... ON CONFLICT DO UPDATE verso table.
+    Le righe identiche a quelle già presenti non vengono riscritte.
+    Ritorna (inserite, aggiornate).
+    """
+    staging = f"{table}_staging"
+    cols = list(columns)
+    others = [c for c in cols if c != key]
+    col_list = ", ".join(cols)
+
+    cur.execute(f"TRUNCATE {staging}")
+    copy_frame(cur, staging, dimension_frame(df, columns), list(columns.values()))
+
+    cur.execute(
+        f"""
+        WITH upserted AS (
+            INSERT INTO {table} AS t ({col_list})
+            SELECT DISTINCT ON ({key}) {col_list}
+            FROM {staging}
+            WHERE {key} IS NOT NULL
+            ORDER BY {key}
+            ON CONFLICT ({key}) DO UPDATE
+            SET {", ".join(f"{c} = EXCLUDED.{c}" for c in others)}
+            WHERE ({", ".join(f"t.{c}" for c in others)})
+                IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in others)})
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM upserted
+        """
+    )
+    inserted, updated = cur.fetchone()
+    return inserted, updated
+
+
+def import_dimension(conn, table: str, filename: str, chunksize=None):
+    """
+    Carica filename in table con upsert_dimension, un commit per blocco.
+    Ritorna (righe lette, inserite, aggiornate).
+    """
+    columns = DIMENSION_COLUMNS[table]
     cur = conn.cursor()
     try:
-        for _, row in df.iterrows():
-            cur.execute(
-                """
-                INSERT INTO stations (id, city_id, name, app_number, terminal_type, place_type,
-                                    bike_racks, special_racks, lon, lat)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id) DO NOTHING
-                """,
-                (
-                    py_value(row["id"]),
-                    py_value(row["city_id"]),
-                    py_value(row.get("name")),
-                    py_value(row.get("app_number")),
-                    py_value(row.get("terminal_type")),
-                    py_value(row.get("place_type")),
-                    py_value(row.get("bike_racks")),
-                    py_value(row.get("special_racks")),
-                    py_value(row.get("lon")),
-                    py_value(row.get("lat")),
-                ),
-            )
+        cur.execute(f"CREATE UNLOGGED TABLE IF NOT EXISTS {table}_staging (LIKE {table})")
         conn.commit()
-        print(f"✓ {len(df)} stazioni importate")
+
+        total = inserted = updated = 0
+        for df in read_csv_chunks(filename, chunksize, dtype=csv_dtypes(columns)):
+            ins, upd = upsert_dimension(cur, table, df, columns)
+            conn.commit()
+            total += len(df)
+            inserted += ins
+            updated += upd
+        return total, inserted, updated
     finally:
         cur.close()
 
 
+def import_cities(conn, chunksize=None):
+    print("Importazione cities...")
+    total, inserted, updated = import_dimension(conn, "cities", "cities.csv", chunksize)
+    print(f"✓ {total} città importate ({inserted} nuove, {updated} aggiornate)")
+
+
+def import_bike_types(conn, chunksize=None):
+    print("Importazione bike_types...")
+    total, inserted, updated = import_dimension(conn, "bike_types", "bike_types.csv", chunksize)
+    print(f"✓ {total} tipi di bici importati ({inserted} nuovi, {updated} aggiornati)")
+
+
+def import_bikes(conn, chunksize=None):
+    print("Importazione bikes...")
+    total, inserted, updated = import_dimension(conn, "bikes", "bikes.csv", chunksize)
+    print(f"✓ {total} biciclette importate ({inserted} nuove, {updated} aggiornate)")
+
+
+def import_stations(conn, chunksize=None):
+    print("Importazione stations...")
+    total, inserted, updated = import_dimension(conn, "stations", "stations.csv", chunksize)
+    print(f"✓ {total} stazioni importate ({inserted} nuove, {updated} aggiornate)")
+
+
 # =============================================================================
 # FK FIXERS (bikes/stations referenced by trips)
 # =============================================================================
 
 def ensure_bikes_for_trips(conn, trips_df: pd.DataFrame):
+    """
+    Inserisce le bikes referenziate dai trips ma assenti in bikes.
+    Gli id unici sono calcolati con pandas; l'anti-join contro la tabella
+    e l'inserimento avvengono lato server in un solo statement (unnest).
+    """
+    bike_ids = pd.unique(trips_df["bike_id"].dropna().astype("int64"))
+
     cur = conn.cursor()
     try:
-        trip_bike_ids = set(trips_df["bike_id"].dropna().astype(int).tolist())
-
-        cur.execute("SELECT id FROM bikes")
-        existing_bike_ids = {r[0] for r in cur.fetchall()}
-
-        missing = sorted(trip_bike_ids - existing_bike_ids)
-        if missing:
-            print(f"  Trovate {len(missing)} bikes mancanti rispetto ai trips. Le inserisco...")
-            for bid in missing:
-                cur.execute(
-                    """
-                    INSERT INTO bikes (id, bike_type_id, computer_id)
-                    VALUES (%s, NULL, NULL)
-                    ON CONFLICT (id) DO NOTHING
-                    """,
-                    (int(bid),),
-                )
-            conn.commit()
-            print("  ✓ bikes mancanti inserite")
+        cur.execute(
+            """
+            INSERT INTO bikes (id, bike_type_id, computer_id)
+            SELECT t.id, NULL, NULL
+            FROM unnest(%s::bigint[]) AS t(id)
+            WHERE NOT EXISTS (SELECT 1 FROM bikes b WHERE b.id = t.id)
+            ON CONFLICT (id) DO NOTHING
+            """,
+            (bike_ids.tolist(),),
+        )
+        inserted = cur.rowcount
+        conn.commit()
+        if inserted:
+            print(f"  ✓ {inserted} bikes mancanti rispetto ai trips inserite")
         else:
             print("  ✓ Tutti i bike_id dei trips sono presenti in bikes")
     finally:
         cur.close()
 
 
-def ensure_stations_for_trips(conn, trips_df: pd.DataFrame):
-    cur = conn.cursor()
-    try:
-        pairs = []
-
-        if "station_id_start" in trips_df.columns:
-            tmp = trips_df[["station_id_start", "city_id"]].dropna(subset=["station_id_start"])
-            for _, r in tmp.iterrows():
-                pairs.append((int(r["station_id_start"]), int(r["city_id"])))
+def trip_station_cities(trips_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Coppie uniche (station_id, city_id) referenziate dai trips, prima le
+    stazioni di partenza e poi quelle di arrivo: per ogni station_id vale
+    la prima city_id incontrata.
+    """
+    parts = []
+    for col in ("station_id_start", "station_id_end"):
+        if col in trips_df.columns:
+            part = trips_df[[col, "city_id"]].dropna(subset=[col])
+            parts.append(part.set_axis(["station_id", "city_id"], axis=1))
 
-        if "station_id_end" in trips_df.columns:
-            tmp = trips_df[["station_id_end", "city_id"]].dropna(subset=["station_id_end"])
-            for _, r in tmp.iterrows():
-                pairs.append((int(r["station_id_end"]), int(r["city_id"])))
+    if not parts:
+        return pd.DataFrame({"station_id": pd.array([], dtype="Int64"),
+                             "city_id": pd.array([], dtype="Int64")})
 
-        station_to_city = {}
-        for sid, cid in pairs:
-            if sid not in station_to_city:
-                station_to_city[sid] = cid
+    pairs = pd.concat(parts, ignore_index=True)
+    pairs = pairs.drop_duplicates(subset="station_id", keep="first")
+    return pairs.astype("Int64")
 
-        trip_station_ids = set(station_to_city.keys())
 
-        cur.execute("SELECT id FROM stations")
-        existing_station_ids = {r[0] for r in cur.fetchall()}
+def ensure_stations_for_trips(conn, trips_df: pd.DataFrame):
+    """
+    Inserisce le stations referenziate dai trips ma assenti in stations,
+    con anti-join lato server e un solo INSERT ... SELECT FROM unnest.
+    """
+    pairs = trip_station_cities(trips_df)
 
-        missing = sorted(trip_station_ids - existing_station_ids)
-        if missing:
-            print(f"  Trovate {len(missing)} stations mancanti rispetto ai trips. Le inserisco...")
-            for sid in missing:
-                cid = station_to_city.get(sid)
-                cur.execute(
-                    """
-                    INSERT INTO stations (id, city_id, name, app_number, terminal_type, place_type,
-                                          bike_racks, special_racks, lon, lat)
-                    VALUES (%s, %s, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL)
-                    ON CONFLICT (id) DO NOTHING
-                    """,
-                    (int(sid), int(cid) if cid is not None else None),
-                )
-            conn.commit()
-            print("  ✓ stations mancanti inserite")
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            INSERT INTO stations (id, city_id, name, app_number, terminal_type, place_type,
+                                  bike_racks, special_racks, lon, lat)
+            SELECT t.id, t.city_id, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL
+            FROM unnest(%s::bigint[], %s::bigint[]) AS t(id, city_id)
+            WHERE NOT EXISTS (SELECT 1 FROM stations s WHERE s.id = t.id)
+            ON CONFLICT (id) DO NOTHING
+            """,
+            (
+                nullable_list(pairs["station_id"]),
+                nullable_list(pairs["city_id"]),
+            ),
+        )
+        inserted = cur.rowcount
+        conn.commit()
+        if inserted:
+            print(f"  ✓ {inserted} stations mancanti rispetto ai trips inserite")
         else:
             print("  ✓ Tutti i station_id dei trips sono presenti in stations")
     finally:
@@ -275,120 +667,540 @@ def ensure_stations_for_trips(conn, trips_df: pd.DataFrame):
 # UTENTI (REALISTIC)
 # =============================================================================
 
-def generate_utenti(conn, n_utenti=300, seed=42):
+# dimensione dei pool di valori Faker usati dalla generazione bulk
+FAKER_POOL_SIZE = 2000
+
+
+def reserve_ids(conn, table: str, n: int) -> np.ndarray:
+    """
+    Riserva n id consecutivi dalla sequence della colonna id di table
+    con un solo round-trip (setval sull'ultimo id del blocco).
+    Pensato per un solo importer alla volta sulla tabella.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT setval(seq, nextval(seq) + %s - 1)
+            FROM pg_get_serial_sequence(%s, 'id') AS seq
+            """,
+            (n, table),
+        )
+        last = cur.fetchone()[0]
+    return np.arange(last - n + 1, last + 1, dtype=np.int64)
+
+
+def generate_utenti_bulk(conn, n_utenti=300, seed=42):
     """
-    Genera N utenti sintetici e ritorna la lista degli id creati.
+    Genera N utenti sintetici e ritorna la lista degli id creati, senza un
+    INSERT ... RETURNING per utente: Faker viene chiamato solo per riempire
+    piccoli pool di nomi e cognomi, le colonne sono estratte per indice con
+    numpy, gli id sono un blocco riservato dalla sequence e il caricamento
+    è un unico COPY csv (copy_frame_csv).
+    Stesso seed => stessi utenti, a parte l'email che contiene l'id
+    riservato (univoca anche tra run successivi sullo stesso database).
     """
-    print(f"Generazione utenti sintetici (n={n_utenti})...")
+    print(f"Generazione utenti sintetici bulk (n={n_utenti})...")
+    t0 = time.perf_counter()
 
     from faker import Faker
+    Faker.seed(seed)
     fake = Faker("it_IT")
-    random.seed(seed)
+    rng = np.random.default_rng(seed)
+
+    nomi = np.array([fake.first_name() for _ in range(FAKER_POOL_SIZE)], dtype=object)
+    cognomi = np.array([fake.last_name() for _ in range(FAKER_POOL_SIZE)], dtype=object)
+    # fake.city() per it_IT pesca da una lista il cui ordine cambia a ogni
+    # processo (hash seed): per restare riproducibili si campiona dalla lista ordinata
+    from faker.providers.address.it_IT import Provider as AddressProviderIT
+    citta = np.array(sorted(AddressProviderIT.cities), dtype=object)
+
+    user_ids = reserve_ids(conn, "utenti", n_utenti)
+    df = pd.DataFrame({
+        "id": user_ids,
+        "nome": nomi[rng.integers(0, FAKER_POOL_SIZE, n_utenti)],
+        "cognome": cognomi[rng.integers(0, FAKER_POOL_SIZE, n_utenti)],
+    })
+    # id riservato nell'email => email univoche anche rigenerando gli utenti
+    # (rerun --incremental, DAG) sullo stesso database
+    df["email"] = (
+        df["nome"].str.lower() + "." + df["cognome"].str.lower()
+        + df["id"].astype(str) + "@email.com"
+    )
+
+    # date già come testo ISO (np.datetime_as_string, in C) per il COPY csv
+    oggi = np.datetime64(pd.Timestamp.now().date(), "D")
+    eta_giorni = rng.integers(18 * 365, 70 * 365 + 1, n_utenti)
+    df["data_nascita"] = np.datetime_as_string(oggi - eta_giorni, unit="D")
+    df["citta"] = citta[rng.integers(0, len(citta), n_utenti)]
+    adesso = np.datetime64(pd.Timestamp.now().to_pydatetime(), "us")
+    giorni_fa = rng.integers(30, 1096, n_utenti).astype("timedelta64[D]")
+    df["data_registrazione"] = np.datetime_as_string(adesso - giorni_fa, unit="us")
+    df["tipo_abbonamento"] = rng.choice(["Mensile", "Annuale"], n_utenti, p=[0.4, 0.6])
+    df["stato"] = rng.choice(["Attivo", "Sospeso"], n_utenti, p=[0.92, 0.08])
+    print(f"  Colonne generate in {time.perf_counter() - t0:.2f}s")
 
     cur = conn.cursor()
     try:
-        user_ids = []
-        for i in range(n_utenti):
-            nome = fake.first_name()
-            cognome = fake.last_name()
-            email = f"{nome.lower()}.{cognome.lower()}{i+1}@email.com"
-            data_nascita = fake.date_of_birth(minimum_age=18, maximum_age=70)
-            citta = fake.city()
-
-            giorni_fa = random.randint(30, 1095)
-            data_registrazione = pd.Timestamp.now() - pd.Timedelta(days=giorni_fa)
+        copy_frame_csv(cur, "utenti", df)
+        conn.commit()
+        elapsed = time.perf_counter() - t0
+        print(f"✓ {n_utenti} utenti generati in {elapsed:.2f}s")
+        return user_ids.tolist()
+    finally:
+        cur.close()
 
-            tipo_abbonamento = random.choices(["Mensile", "Annuale"], weights=[40, 60])[0]
-            stato = random.choices(["Attivo", "Sospeso"], weights=[92, 8])[0]
 
-            cur.execute(
-                """
-                INSERT INTO utenti (bike_id, nome, cognome, email, data_nascita, citta,
-                                  data_registrazione, tipo_abbonamento, stato)
-                VALUES (NULL, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-                """,
-                (
-                    nome, cognome, email, data_nascita, citta,
-                    data_registrazione, tipo_abbonamento, stato
-                ),
-            )
-            user_ids.append(cur.fetchone()[0])
+def existing_user_ids(conn) -> list:
+    """id degli utenti già presenti in utenti, in ordine."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM utenti ORDER BY id")
+        return [row[0] for row in cur.fetchall()]
 
-            if (i + 1) % 100 == 0:
-                conn.commit()
-                print(f"  Generati {i+1}/{n_utenti} utenti...")
 
+def load_or_generate_utenti(conn, n_utenti=300, seed=42, reuse=False):
+    """
+    reuse=True (rerun --incremental): se utenti ha già righe ritorna i loro
+    id senza generarne altri, così i trips ripresi campionano dagli stessi
+    utenti del primo run. Altrimenti genera n_utenti con generate_utenti_bulk.
+    """
+    if reuse:
+        user_ids = existing_user_ids(conn)
         conn.commit()
-        print(f"✓ {n_utenti} utenti generati")
-        return user_ids
-    finally:
-        cur.close()
+        if user_ids:
+            print(f"✓ {len(user_ids)} utenti già presenti, nessun utente generato")
+            return user_ids
+    return generate_utenti_bulk(conn, n_utenti=n_utenti, seed=seed)
 
 
 # =============================================================================
 # TRIPS (with user_id)
 # =============================================================================
 
-def import_trips(conn, user_ids):
-    print("Importazione trips...")
-    df = pd.read_csv(assert_csv_exists("trips.csv"))
+def has_trip_time_columns(conn) -> bool:
+    """True se trips ha time_start_utc/time_start_local (schema creato da create_schema)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT count(*) FROM information_schema.columns
+            WHERE table_name = 'trips' AND column_name IN ('time_start_utc', 'time_start_local')
+            """
+        )
+        row = cur.fetchone()
+    return bool(row) and row[0] == 2
+
+
+def load_city_timezones(conn) -> dict:
+    """city_id -> timezone, letto una volta per import (cities è già caricata)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, timezone FROM cities WHERE timezone IS NOT NULL")
+        return {int(city_id): tz for city_id, tz in cur.fetchall()}
 
-    # Fix FK: bikes e stations mancanti
-    ensure_bikes_for_trips(conn, df)
-    ensure_stations_for_trips(conn, df)
+
+def trip_times(df: pd.DataFrame, city_tz: dict) -> pd.DataFrame:
+    """Colonne time_start_utc / time_start_local di un blocco di trips."""
+    utc = epoch_to_utc(df["time_start"])
+    return pd.DataFrame({
+        "time_start_utc": utc,
+        "time_start_local": local_times(utc, df["city_id"], city_tz),
+    }, index=df.index)
+
+
+def import_trips(conn, user_ids, chunksize=None, seed=42):
+    print("Importazione trips...")
 
     # Sampler utenti realistico (pochi super-attivi)
-    pick_user = make_heavy_user_sampler(user_ids, alpha=1.25)
+    pick_user = make_heavy_user_sampler(user_ids, alpha=1.25, seed=seed)
+    partitioning = trips_partitioning(conn)
+    city_tz = load_city_timezones(conn) if has_trip_time_columns(conn) else None
 
     cur = conn.cursor()
     try:
         count = 0
-        total = len(df)
 
-        for _, row in df.iterrows():
-            user_id = pick_user()
+        for df in read_csv_chunks("trips.csv", chunksize):
+            # Fix FK: bikes e stations mancanti
+            ensure_bikes_for_trips(conn, df)
+            ensure_stations_for_trips(conn, df)
+            if partitioning is not None:
+                ensure_trip_partitions(conn, df["time_start"], partitioning)
 
-            cur.execute(
-                """
-                INSERT INTO trips (bike_id, city_id, time_start, lon_start, lat_start, lon_end, lat_end,
-                                 station_id_start, station_id_end, battery_start, battery_end, duration, distance, user_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    py_value(row["bike_id"]),
-                    py_value(row["city_id"]),
-                    py_value(row["time_start"]),
-                    py_value(row.get("lon_start")),
-                    py_value(row.get("lat_start")),
-                    py_value(row.get("lon_end")),
-                    py_value(row.get("lat_end")),
-                    py_value(row.get("station_id_start")),
-                    py_value(row.get("station_id_end")),
-                    py_value(row.get("battery_start")),
-                    py_value(row.get("battery_end")),
-                    py_value(row["duration"]),
-                    py_value(row["distance"]),
-                    user_id,
-                ),
-            )
+            times = trip_times(df, city_tz) if city_tz is not None else None
 
-            count += 1
-            if count % 100 == 0:
-                conn.commit()
-                print(f"  Importati {count}/{total} trips...")
+            for i, (_, row) in enumerate(df.iterrows()):
+                user_id = pick_user()
+
+                cur.execute(
+                    """
+                    INSERT INTO trips (bike_id, city_id, time_start, lon_start, lat_start, lon_end, lat_end,
+                                     station_id_start, station_id_end, battery_start, battery_end, duration, distance, user_id)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """ if times is None else
+                    """
+                    INSERT INTO trips (bike_id, city_id, time_start, lon_start, lat_start, lon_end, lat_end,
+                                     station_id_start, station_id_end, battery_start, battery_end, duration, distance, user_id,
+                                     time_start_utc, time_start_local)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (
+                        py_value(row["bike_id"]),
+                        py_value(row["city_id"]),
+                        py_value(row["time_start"]),
+                        py_value(row.get("lon_start")),
+                        py_value(row.get("lat_start")),
+                        py_value(row.get("lon_end")),
+                        py_value(row.get("lat_end")),
+                        py_value(row.get("station_id_start")),
+                        py_value(row.get("station_id_end")),
+                        py_value(row.get("battery_start")),
+                        py_value(row.get("battery_end")),
+                        py_value(row["duration"]),
+                        py_value(row["distance"]),
+                        user_id,
+                    ) + (() if times is None else (
+                        py_value(times["time_start_utc"].iat[i]),
+                        py_value(times["time_start_local"].iat[i]),
+                    )),
+                )
+
+                count += 1
+                if count % 100 == 0:
+                    conn.commit()
+                    print(f"  Importati {count} trips...")
 
         conn.commit()
-        print(f"✓ {total} trips importati")
+        print(f"✓ {count} trips importati")
+    finally:
+        cur.close()
+
+
+def trips_copy_frame(df: pd.DataFrame, pick_user) -> pd.DataFrame:
+    """
+    Prepara i trips per COPY: colonne tipizzate (id interi nullable) + user_id.
+    """
+    out = pd.DataFrame(index=df.index)
+    for col, pg_type in TRIPS_COPY_COLUMNS.items():
+        s = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype="float64")
+        out[col] = s.astype("Int64") if pg_type == "int8" else s.astype("float64")
+
+    out["user_id"] = pd.array(pick_user(len(out)), dtype="Int64")
+    return out
+
+
+def read_watermark(conn, source: str) -> int:
+    """
+    Righe del file source già caricate (0 se mai importato).
+    Crea la tabella import_watermarks se non esiste.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS import_watermarks (
+                source      TEXT PRIMARY KEY,
+                rows_done   BIGINT NOT NULL,
+                updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """
+        )
+        cur.execute("SELECT rows_done FROM import_watermarks WHERE source = %s", (source,))
+        row = cur.fetchone()
+    conn.commit()
+    return row[0] if row else 0
+
+
+def has_rows(conn, table: str) -> bool:
+    """True se table contiene almeno una riga."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        found = cur.fetchone()[0]
+    conn.commit()
+    return found
+
+
+def write_watermark(cur, source: str, rows_done: int):
+    """Aggiorna il watermark nella transazione corrente (senza commit)."""
+    cur.execute(
+        """
+        INSERT INTO import_watermarks (source, rows_done, updated_at)
+        VALUES (%s, %s, now())
+        ON CONFLICT (source) DO UPDATE
+        SET rows_done = EXCLUDED.rows_done, updated_at = EXCLUDED.updated_at
+        """,
+        (source, rows_done),
+    )
+
+
+def validate_trips(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Controlli di plausibilità su un blocco di trips, tutti vettoriali.
+    Ritorna haversine_m, speed_kmh e reason (None = trip valido); se più
+    controlli falliscono vale il primo in ordine di gravità.
+    Trips senza coordinate non sono verificabili e restano validi.
+    """
+    dist = haversine_m(df["lon_start"], df["lat_start"], df["lon_end"], df["lat_end"])
+    duration = df["duration"].to_numpy(dtype=np.float64)
+    reported = df["distance"].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(duration > 0, dist / duration * 3.6, np.nan)
+
+    tolerance = DISTANCE_TOLERANCE_M + DISTANCE_TOLERANCE_RATIO * dist
+    checks = [
+        ("zero_duration", duration <= 0),
+        ("teleport", dist > MAX_TRIP_DISTANCE_M),
+        ("too_fast", speed > MAX_SPEED_KMH),
+        ("distance_mismatch", np.abs(reported - dist) > tolerance),
+    ]
+    reason = np.full(len(df), None, dtype=object)
+    for name, failed in reversed(checks):
+        reason[failed] = name
+
+    return pd.DataFrame({"haversine_m": dist, "speed_kmh": speed, "reason": reason},
+                        index=df.index)[list(QUARANTINE_CHECK_COLUMNS)]
+
+
+def out_of_area(index, df: pd.DataFrame) -> np.ndarray:
+    """
+    True dove partenza o arrivo cadono fuori dall'area di servizio della
+    città (CityAreasIndex.contains, tutto il blocco insieme). Punti senza
+    coordinate e città senza area in city_areas.csv non vengono segnalati.
+    """
+    city_ids = df["city_id"].to_numpy(dtype=np.float64, na_value=np.nan)
+    with_area = np.isin(city_ids, index.city_ids)
+    out = np.zeros(len(df), dtype=bool)
+    for end in ("start", "end"):
+        lon = df[f"lon_{end}"].to_numpy(dtype=np.float64, na_value=np.nan)
+        lat = df[f"lat_{end}"].to_numpy(dtype=np.float64, na_value=np.nan)
+        known = with_area & ~(np.isnan(lon) | np.isnan(lat))
+        out |= known & ~index.contains(city_ids, lon, lat)
+    return out
+
+
+def ensure_quarantine_table(conn):
+    """Crea trips_quarantine se manca (import con --validate senza --create-schema)."""
+    with conn.cursor() as cur:
+        cur.execute(TRIPS_QUARANTINE_SQL)
+    conn.commit()
+
+
+def import_trips_copy(conn, user_ids, chunksize=None, seed=42, incremental=False,
+                      snap_distance=None, validate=False, geofence=False):
+    """
+    Come import_trips, ma carica i trips con COPY ... FROM STDIN
+    (psycopg cursor.copy) invece di un INSERT per riga.
+    Con chunksize ogni blocco passa da fix FK + COPY + commit prima di
+    leggere il successivo.
+
+    Il watermark (righe del file caricate, in import_watermarks) viene
+    aggiornato sempre, nella stessa transazione del COPY di ogni blocco.
+    incremental=True: riparte dalla riga del file successiva all'ultimo
+    blocco committato. Su un file in append un rerun carica solo le righe
+    nuove; dopo un crash riprende dall'ultimo blocco. Se trips ha già righe
+    ma il watermark manca (caricate da un altro loader) l'import viene
+    rifiutato invece di ricaricare tutto il file.
+
+    snap_distance (metri): i trips senza station_id vengono agganciati alla
+    stazione più vicina della stessa città entro la soglia (station_snapping),
+    prima che ensure_stations_for_trips crei stazioni segnaposto.
+
+    validate=True: i trips che falliscono validate_trips (durata nulla,
+    teletrasporto, velocità impossibile, distance incoerente) vanno in
+    trips_quarantine con il motivo, invece che in trips.
+
+    geofence=True: anche i trips che partono o arrivano fuori dall'area di
+    servizio della città (city_areas_index) vanno in trips_quarantine, con
+    reason "out_of_area" se non hanno già un motivo da validate_trips.
+    """
+    print("Importazione trips (COPY)...")
+
+    snapper = None
+    if snap_distance is not None:
+        from station_snapping import StationSnapper
+        snapper = StationSnapper.from_csv(assert_csv_exists("stations.csv"), snap_distance)
+        snapped = unmatched = 0
+    areas = None
+    if geofence:
+        from city_areas_index import CityAreasIndex
+        areas = CityAreasIndex.from_csv(assert_csv_exists("city_areas.csv"))
+    quarantined = out_of_area_count = 0
+    if validate or geofence:
+        ensure_quarantine_table(conn)
+
+    pick_user = make_heavy_user_sampler(user_ids, alpha=1.25, seed=seed)
+    types = list(TRIPS_COPY_COLUMNS.values()) + ["int8"]
+
+    partitioning = trips_partitioning(conn)
+    city_tz = load_city_timezones(conn) if has_trip_time_columns(conn) else None
+    trips_types = types if city_tz is None else types + ["timestamptz", "timestamp"]
+    quarantine_types = types + list(QUARANTINE_CHECK_COLUMNS.values())
+
+    source = "trips.csv"
+    done = read_watermark(conn, source)
+    if not incremental:
+        done = 0
+    elif done == 0 and has_rows(conn, "trips"):
+        raise ValueError(
+            "--incremental: trips contiene già righe ma non c'è un watermark per "
+            f"{source} (caricate senza il loader copy?): import rifiutato"
+        )
+    if done:
+        print(f"  Watermark: {done} righe già importate, riprendo da lì")
+
+    cur = conn.cursor()
+    try:
+        total = 0
+        t0 = time.perf_counter()
+
+        for df in read_csv_chunks(source, chunksize, skip_rows=done):
+            if snapper is not None:
+                df, snap_stats = snapper.snap_trips(df)
+                snapped += sum(st["snapped"] for st in snap_stats.values())
+                unmatched += sum(st["unmatched"] for st in snap_stats.values())
+
+            data = trips_copy_frame(df, pick_user)
+            n_read = len(data)
+            bad = None
+            if validate or geofence:
+                checks = validate_trips(df)
+                if not validate:
+                    checks["reason"] = None
+                if areas is not None:
+                    outside = out_of_area(areas, df) & checks["reason"].isna().to_numpy()
+                    checks.loc[outside, "reason"] = "out_of_area"
+                    out_of_area_count += int(outside.sum())
+                bad = checks["reason"].notna().to_numpy()
+                quarantine = pd.concat([data[bad], checks[bad]], axis=1)
+                df, data = df[~bad], data[~bad]
+
+            # Fix FK: bikes e stations mancanti
+            ensure_bikes_for_trips(conn, df)
+            ensure_stations_for_trips(conn, df)
+            if partitioning is not None:
+                ensure_trip_partitions(conn, df["time_start"], partitioning)
+
+            # quarantena, trips e watermark nella stessa transazione
+            if bad is not None and bad.any():
+                copy_frame(cur, "trips_quarantine", quarantine, quarantine_types)
+                quarantined += len(quarantine)
+            if city_tz is not None:
+                data = pd.concat([data, trip_times(df, city_tz)], axis=1)
+            copy_frame(cur, "trips", data, trips_types)
+            total += n_read
+            write_watermark(cur, source, done + total)
+            conn.commit()
+
+            if chunksize is not None:
+                print(f"  Importati {total} trips...")
+
+        elapsed = time.perf_counter() - t0
+        rate = total / elapsed if elapsed > 0 else float("inf")
+        print(f"✓ {total - quarantined} trips importati in {elapsed:.2f}s ({rate:,.0f} righe/s)")
+        if validate or geofence:
+            print(f"  Validazione: {quarantined} trips messi in trips_quarantine"
+                  + (f" ({out_of_area_count} fuori area)" if geofence else ""))
+        if snapper is not None:
+            print(f"  Snapping stazioni: {snapped} estremi agganciati, {unmatched} non agganciati")
     finally:
         cur.close()
 
 
+# =============================================================================
+# IMPORT DAG (tabelle indipendenti in parallelo)
+# =============================================================================
+
+# tabella -> tabelle che devono essere già caricate (FK)
+IMPORT_DEPENDENCIES = {
+    "cities": (),
+    "bike_types": (),
+    "bikes": ("bike_types",),
+    "stations": ("cities",),
+    "utenti": (),
+    "trips": ("cities", "bikes", "stations", "utenti"),
+}
+
+
+def make_import_steps(trips_loader="copy", chunksize=None, n_utenti=300, **trips_options):
+    """
+    tabella -> funzione(conn, results). results contiene il valore ritornato
+    dagli step già completati (es. results["utenti"] = lista degli user_id).
+    trips_options vengono passate al loader dei trips (es. incremental).
+    """
+    return {
+        "cities": lambda conn, results: import_cities(conn, chunksize),
+        "bike_types": lambda conn, results: import_bike_types(conn, chunksize),
+        "bikes": lambda conn, results: import_bikes(conn, chunksize),
+        "stations": lambda conn, results: import_stations(conn, chunksize),
+        "utenti": lambda conn, results: load_or_generate_utenti(
+            conn, n_utenti=n_utenti, seed=42, reuse=trips_options.get("incremental", False)
+        ),
+        "trips": lambda conn, results: TRIPS_LOADERS[trips_loader](
+            conn, results["utenti"], chunksize, **trips_options
+        ),
+    }
+
+
+def run_import_sequential(conn, steps, dependencies=IMPORT_DEPENDENCIES):
+    """Esegue gli step uno dopo l'altro sulla stessa connessione."""
+    results, timings = {}, {}
+    for name in dependencies:
+        t0 = time.perf_counter()
+        results[name] = steps[name](conn, results)
+        timings[name] = time.perf_counter() - t0
+    return results, timings
+
+
+def run_import_dag(pool, steps, dependencies=IMPORT_DEPENDENCIES, max_workers=4):
+    """
+    Esegue gli step come DAG su un pool di connessioni: ogni tabella parte
+    appena le sue dipendenze sono completate, quelle indipendenti in parallelo.
+    """
+    results, timings = {}, {}
+    pending = dict(dependencies)
+    running = {}
+
+    def run(name):
+        t0 = time.perf_counter()
+        with pool.connection() as conn:
+            out = steps[name](conn, results)
+        return out, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = [n for n, deps in pending.items() if all(d in results for d in deps)]
+            for name in ready:
+                del pending[name]
+                running[executor.submit(run, name)] = name
+
+            if not running:
+                raise ValueError(f"Dipendenze non risolvibili: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], timings[name] = future.result()
+
+    return results, timings
+
+
+def print_timings(timings, wall_time):
+    print("\nTempi per tabella:")
+    for name, seconds in timings.items():
+        print(f"  - {name:<12} {seconds:8.2f}s")
+    print(f"  {'totale':<14} {wall_time:8.2f}s (wall clock)")
+
+
 # =============================================================================
 # MAIN
 # =============================================================================
 
-def main():
+TRIPS_LOADERS = {
+    "insert": import_trips,
+    "copy": import_trips_copy,
+}
+
+
+def main(trips_loader="copy", chunksize=None, workers=1, incremental=False, n_utenti=300,
+         schema=False, snap_distance=None, validate=False, partitioning=None, staging=False,
+         geofence=False):
+    global USE_STAGING
     print("=" * 70)
     print("IMPORT DATASET REALE EUROPEAN BIKE SHARING")
     print("=" * 70)
@@ -396,18 +1208,46 @@ def main():
     if not DATA_DIR.exists():
         raise FileNotFoundError(f"DATA_DIR non esiste: {DATA_DIR}")
 
+    trips_options = {}
+    if incremental:
+        trips_options["incremental"] = True
+    if snap_distance is not None:
+        trips_options["snap_distance"] = snap_distance
+    if validate:
+        trips_options["validate"] = True
+    if geofence:
+        trips_options["geofence"] = True
+    if trips_options and trips_loader != "copy":
+        raise ValueError(f"{', '.join(trips_options)} richiede --trips-loader copy")
+
+    if chunksize is not None:
+        print(f"Modalità streaming: blocchi da {chunksize} righe\n")
+    if staging:
+        USE_STAGING = True
+        print("Lettura dalla cache Parquet (data/staging)\n")
+
+    steps = make_import_steps(trips_loader, chunksize, n_utenti, **trips_options)
+
     conn = None
     try:
-        conn = connect_db()
-        print("✓ Connesso al database\n")
-
-        import_cities(conn)
-        import_bike_types(conn)
-        import_bikes(conn)
-        import_stations(conn)
+        if schema:
+            with connect_db() as schema_conn:
+                create_schema(schema_conn, partitioning)
+
+        t0 = time.perf_counter()
+        if workers > 1:
+            from psycopg_pool import ConnectionPool
+
+            conninfo = psycopg.conninfo.make_conninfo(**DB_CONFIG)
+            with ConnectionPool(conninfo, min_size=1, max_size=workers, open=True) as pool:
+                print(f"✓ Pool di connessioni aperto (max {workers})\n")
+                _, timings = run_import_dag(pool, steps, max_workers=workers)
+        else:
+            conn = connect_db()
+            print("✓ Connesso al database\n")
+            _, timings = run_import_sequential(conn, steps)
 
-        user_ids = generate_utenti(conn, n_utenti=300, seed=42)
-        import_trips(conn, user_ids)
+        print_timings(timings, time.perf_counter() - t0)
 
         print("\n" + "=" * 70)
         print("✓ IMPORT COMPLETATO CON SUCCESSO!")
@@ -422,5 +1262,64 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Import dataset European Bike Sharing")
+    parser.add_argument(
+        "--trips-loader", choices=sorted(TRIPS_LOADERS), default="copy",
+        help="insert = un INSERT per riga (originale), copy = COPY FROM STDIN",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="legge i CSV a blocchi di N righe (streaming, memoria limitata dal chunk)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="N > 1: tabelle indipendenti in parallelo su un pool di N connessioni",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="trips: carica solo le righe dopo il watermark dell'ultimo run "
+             "(riusa gli utenti già presenti)",
+    )
+    parser.add_argument(
+        "--utenti", type=int, default=300,
+        help="numero di utenti sintetici da generare",
+    )
+    parser.add_argument(
+        "--create-schema", action="store_true",
+        help="crea le tabelle mancanti prima dell'import",
+    )
+    parser.add_argument(
+        "--snap-stations", type=float, default=None, metavar="METRI",
+        help="aggancia i trips senza station_id alla stazione più vicina entro METRI",
+    )
+    parser.add_argument(
+        "--validate", action="store_true",
+        help="trips non plausibili (durata, distanza, velocità) in trips_quarantine",
+    )
+    parser.add_argument(
+        "--geofence", action="store_true",
+        help="trips con partenza/arrivo fuori dall'area della città in trips_quarantine",
+    )
+    parser.add_argument(
+        "--partition-trips", choices=["month", "month_city"], default=None,
+        help="con --create-schema: trips partizionata per mese (e hash di city_id)",
+    )
+    parser.add_argument(
+        "--staging", action="store_true",
+        help="legge i CSV dalla cache Parquet tipizzata (creata/aggiornata se serve)",
+    )
+    args = parser.parse_args()
+    main(
+        trips_loader=args.trips_loader,
+        chunksize=args.chunk_size,
+        workers=args.workers,
+        incremental=args.incremental,
+        n_utenti=args.utenti,
+        schema=args.create_schema,
+        snap_distance=args.snap_stations,
+        validate=args.validate,
+        partitioning=args.partition_trips,
+        staging=args.staging,
+        geofence=args.geofence,
+    )
 
@@ -0,0 +1,382 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Parte 2: Benchmark dell'import
+
+Misura il throughput di 03_import_data(1).py su un PostgreSQL usa e getta:
+per ogni tabella registra righe/s, numero di commit e picco di memoria.
+Parte dai CSV sample di data/ e può generare copie scalate (10x, 100x, 1000x).
+I risultati vanno in un file JSON confrontabile tra un run e l'altro.
+
+Con --partitioning si confronta anche la latenza delle query per intervallo
+di tempo (city_id + finestra su time_start) tra trips normale e partizionata.
+
+Esempi:
+    python 04_benchmark_import.py --scale 1 10
+    python 04_benchmark_import.py --scale 100 --chunk-size 50000
+    python 04_benchmark_import.py --scale 100 --partitioning none month month_city
+    python 04_benchmark_import.py --compare bench_results/import_A.json bench_results/import_B.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psycopg
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+BASE_DIR = Path(__file__).resolve().parent
+IMPORTER_PATH = BASE_DIR / "03_import_data(1).py"
+SAMPLE_DIR = BASE_DIR / "data"
+RESULTS_DIR = BASE_DIR / "bench_results"
+
+# Nelle copie scalate gli id delle entità che crescono col volume vengono
+# spostati di k * ID_STRIDE (k = indice della copia), così restano univoci
+# e le FK dei trips restano coerenti. cities e bike_types non scalano.
+ID_STRIDE = 10**9
+SCALED_ID_COLUMNS = {
+    "bikes.csv": ["id"],
+    "stations.csv": ["id"],
+    "trips.csv": ["bike_id", "station_id_start", "station_id_end"],
+}
+
+# nelle copie scalate time_start avanza di un giorno per copia, così i dati
+# coprono più mesi (e più partizioni) invece di ammassarsi sugli stessi giorni
+SCALE_TIME_SHIFT_S = 86400
+
+# query per intervallo usate per misurare l'effetto del partizionamento
+RANGE_QUERY_SQL = """
+SELECT count(*), avg(duration)
+FROM trips
+WHERE city_id = %s AND time_start >= %s AND time_start < %s
+"""
+RANGE_QUERY_WINDOW_S = 7 * 86400
+
+# porta del server temporaneo (solo socket Unix, nessun listen TCP)
+TEMP_PG_PORT = 54329
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def load_importer():
+    """Carica 03_import_data(1).py come modulo (il nome non è importabile)."""
+    spec = importlib.util.spec_from_file_location("import_data", IMPORTER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_scaled_csvs(src_dir: Path, dst_dir: Path, scale: int):
+    """Scrive in dst_dir i CSV di src_dir replicati scale volte."""
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    for csv in sorted(src_dir.glob("*.csv")):
+        out = dst_dir / csv.name
+        id_cols = SCALED_ID_COLUMNS.get(csv.name)
+        if scale == 1 or not id_cols:
+            shutil.copyfile(csv, out)
+            continue
+
+        df = pd.read_csv(csv)
+        for col in id_cols:
+            df[col] = df[col].astype("Int64")
+        for k in range(scale):
+            part = df.copy()
+            for col in id_cols:
+                part[col] = part[col] + k * ID_STRIDE
+            if "time_start" in part.columns:
+                part["time_start"] = part["time_start"] + k * SCALE_TIME_SHIFT_S
+            part.to_csv(out, mode="a" if k else "w", header=(k == 0), index=False)
+
+
+@contextmanager
+def throwaway_postgres(dsn=None):
+    """
+    Ritorna un DB_CONFIG per un database usa e getta.
+    Senza dsn: initdb + pg_ctl in una directory temporanea (serve PostgreSQL
+    installato in locale). Con dsn (es. "host=localhost user=postgres
+    password=postgres"): crea un database bench_<pid> su quel server e lo
+    elimina alla fine.
+    """
+    if dsn is None:
+        initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+        if initdb is None or pg_ctl is None:
+            raise RuntimeError("initdb/pg_ctl non trovati: installa PostgreSQL oppure usa --dsn")
+
+        with tempfile.TemporaryDirectory(prefix="bench_pg_") as tmp:
+            data = Path(tmp) / "data"
+            subprocess.run(
+                [initdb, "-D", str(data), "-U", "postgres", "-A", "trust"],
+                check=True, stdout=subprocess.DEVNULL,
+            )
+            subprocess.run(
+                [pg_ctl, "-D", str(data), "-l", str(Path(tmp) / "postgres.log"), "-w",
+                 "-o", f"-k {tmp} -p {TEMP_PG_PORT} -c listen_addresses=''", "start"],
+                check=True, stdout=subprocess.DEVNULL,
+            )
+            try:
+                yield {"dbname": "postgres", "user": "postgres", "host": tmp, "port": TEMP_PG_PORT}
+            finally:
+                subprocess.run(
+                    [pg_ctl, "-D", str(data), "-m", "immediate", "-w", "stop"],
+                    check=False, stdout=subprocess.DEVNULL,
+                )
+    else:
+        params = psycopg.conninfo.conninfo_to_dict(dsn)
+        dbname = f"bench_{os.getpid()}"
+        with psycopg.connect(dsn, autocommit=True) as admin:
+            admin.execute(f"CREATE DATABASE {dbname}")
+        try:
+            yield {**params, "dbname": dbname}
+        finally:
+            with psycopg.connect(dsn, autocommit=True) as admin:
+                admin.execute(f"DROP DATABASE IF EXISTS {dbname} WITH (FORCE)")
+
+
+class CountingConnection:
+    """Proxy di una connessione psycopg che conta i commit."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+        self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def count_rows(conn, table: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {table}")
+        return cur.fetchone()[0]
+
+
+def benchmark_range_queries(conn, n_queries=50, seed=0) -> dict:
+    """Latenza (ms) di RANGE_QUERY_SQL su città e finestre casuali."""
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE trips")
+        cur.execute("SELECT min(time_start), max(time_start) FROM trips")
+        t_min, t_max = cur.fetchone()
+        cur.execute("SELECT DISTINCT city_id FROM trips WHERE city_id IS NOT NULL")
+        cities = [r[0] for r in cur.fetchall()]
+    if t_min is None or not cities:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    latencies = []
+    with conn.cursor() as cur:
+        for _ in range(n_queries):
+            city = int(rng.choice(cities))
+            start = float(rng.uniform(t_min, max(t_min, t_max - RANGE_QUERY_WINDOW_S)))
+            t0 = time.perf_counter()
+            cur.execute(RANGE_QUERY_SQL, (city, start, start + RANGE_QUERY_WINDOW_S))
+            cur.fetchall()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    latencies = np.array(latencies)
+    return {
+        "queries": n_queries,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def warm_up_faker():
+    """
+    Faker e il locale it_IT usati da generate_utenti_bulk vengono caricati
+    fuori dalle misure: al primo Faker("it_IT") del processo si importano
+    i provider del locale (a disco freddo anche decine di secondi), che
+    altrimenti finirebbero nel tempo e nel picco di memoria dello step
+    utenti del primo run.
+    """
+    from faker import Faker
+    from faker.providers.address.it_IT import Provider  # noqa: F401 (città di generate_utenti_bulk)
+
+    fake = Faker("it_IT")
+    fake.first_name()
+    fake.last_name()
+
+
+def run_benchmark(importer, data_dir: Path, db_config: dict, trips_loader="copy",
+                  chunksize=None, n_utenti=300, track_memory=True, partitioning=None,
+                  range_queries=0):
+    """
+    Esegue tutti gli step di import e ritorna (metriche per tabella,
+    latenze delle query per intervallo se range_queries > 0).
+    """
+    importer.DATA_DIR = data_dir
+    importer.DB_CONFIG = db_config
+
+    steps = importer.make_import_steps(trips_loader, chunksize, n_utenti=n_utenti)
+    tables = {}
+
+    warm_up_faker()
+
+    with importer.connect_db() as raw_conn:
+        importer.create_schema(raw_conn, partitioning)
+        conn = CountingConnection(raw_conn)
+        results = {}
+
+        for name in importer.IMPORT_DEPENDENCIES:
+            before = count_rows(conn, name)
+            commits_before = conn.commits
+            if track_memory:
+                tracemalloc.start()
+
+            t0 = time.perf_counter()
+            results[name] = steps[name](conn, results)
+            elapsed = time.perf_counter() - t0
+
+            peak = None
+            if track_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            rows = count_rows(conn, name) - before
+            tables[name] = {
+                "rows": rows,
+                "seconds": round(elapsed, 4),
+                "rows_per_s": round(rows / elapsed, 1) if elapsed > 0 else None,
+                "commits": conn.commits - commits_before,
+                "peak_mem_mb": round(peak / 2**20, 2) if peak is not None else None,
+            }
+            print(f"  [bench] {name:<12} {rows:>10,} righe  {elapsed:8.2f}s  "
+                  f"{tables[name]['commits']:>6} commit")
+
+        range_stats = benchmark_range_queries(raw_conn, range_queries) if range_queries else {}
+        if range_stats:
+            print(f"  [bench] range query  p50 {range_stats['p50_ms']:.2f} ms  "
+                  f"p95 {range_stats['p95_ms']:.2f} ms")
+
+    return tables, range_stats
+
+
+def compare_results(old_path: Path, new_path: Path):
+    """Stampa righe/s per tabella e scala di due file di risultati."""
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+
+    for key, new_run in new["runs"].items():
+        old_run = old["runs"].get(key)
+        if old_run is None:
+            continue
+        print(f"\nRun {key}  ({old_path} -> {new_path})")
+        for table, metrics in new_run["tables"].items():
+            before = old_run["tables"].get(table, {}).get("rows_per_s")
+            after = metrics.get("rows_per_s")
+            ratio = f"{after / before:6.2f}x" if before and after else "     -"
+            print(f"  {table:<12} {before or 0:>12,.0f} -> {after or 0:>12,.0f} righe/s  {ratio}")
+
+        before = old_run.get("range_queries", {}).get("p50_ms")
+        after = new_run.get("range_queries", {}).get("p50_ms")
+        if before and after:
+            print(f"  {'range p50':<12} {before:>12.2f} -> {after:>12.2f} ms       {before / after:6.2f}x")
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import bike sharing")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1],
+                        help="fattori di scala dei CSV sample (es. 1 10 100 1000)")
+    parser.add_argument("--trips-loader", choices=["insert", "copy"], default="copy")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--utenti", type=int, default=300)
+    parser.add_argument("--dsn", default=None,
+                        help="server esistente su cui creare un database temporaneo")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="non misura il picco di memoria (tracemalloc rallenta l'import)")
+    parser.add_argument("--partitioning", nargs="+", default=["none"],
+                        choices=["none", "month", "month_city"],
+                        help="layout di trips da confrontare (un database per layout)")
+    parser.add_argument("--range-queries", type=int, default=50,
+                        help="query per intervallo da misurare dopo l'import (0 = nessuna)")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"),
+                        help="confronta due file di risultati e termina")
+    args = parser.parse_args()
+
+    # i run sono indicizzati per x{scale}_{layout}: un valore ripetuto
+    # sovrascriverebbe in silenzio il run precedente
+    for option, values in (("--scale", args.scale), ("--partitioning", args.partitioning)):
+        repeated = sorted({v for v in values if values.count(v) > 1})
+        if repeated:
+            parser.error(f"{option}: valori ripetuti {repeated}")
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+
+    importer = load_importer()
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "trips_loader": args.trips_loader,
+        "chunk_size": args.chunk_size,
+        "utenti": args.utenti,
+        "runs": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench_csv_") as tmp:
+        for scale in args.scale:
+            print("=" * 70)
+            print(f"BENCHMARK IMPORT - scala {scale}x")
+            print("=" * 70)
+
+            data_dir = Path(tmp) / f"x{scale}"
+            write_scaled_csvs(SAMPLE_DIR, data_dir, scale)
+
+            for layout in args.partitioning:
+                partitioning = None if layout == "none" else layout
+                with throwaway_postgres(args.dsn) as db_config:
+                    t0 = time.perf_counter()
+                    tables, range_stats = run_benchmark(
+                        importer, data_dir, db_config,
+                        trips_loader=args.trips_loader,
+                        chunksize=args.chunk_size,
+                        n_utenti=args.utenti,
+                        track_memory=not args.no_memory,
+                        partitioning=partitioning,
+                        range_queries=args.range_queries,
+                    )
+                    report["runs"][f"x{scale}_{layout}"] = {
+                        "total_seconds": round(time.perf_counter() - t0, 4),
+                        "tables": tables,
+                        "range_queries": range_stats,
+                    }
+
+    report["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    output = args.output or RESULTS_DIR / f"import_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n✓ Risultati salvati in {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Indice spaziale sulle aree di servizio delle città (city_areas.csv)
+
+Il WKB di ogni area (geom_ewkb) viene decodificato una sola volta in array
+di coordinate impacchettati (tutti i vertici in un unico array, più gli
+offset degli anelli). Sopra c'è una griglia regolare sui bounding box delle
+città: per milioni di punti (lon_start/lat_start, lon_end/lat_end) si
+trovano le città candidate con searchsorted e si esegue il test
+point-in-polygon (ray casting, pari/dispari) in numpy, un lato alla volta
+su tutti i punti candidati: nessun loop per riga.
+
+Esecuzione:
+    python city_areas_index.py data/trips.csv
+"""
+
+import argparse
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from geo_utils import city_groups
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# lato delle celle della griglia, in gradi
+GRID_CELL_DEG = 0.25
+
+WKB_POLYGON = 3
+WKB_MULTIPOLYGON = 6
+EWKB_SRID_FLAG = 0x20000000
+EWKB_Z_FLAG = 0x80000000
+EWKB_M_FLAG = 0x40000000
+
+
+# =============================================================================
+# WKB
+# =============================================================================
+
+def _read_geometry(buf: bytes, pos: int, rings: list) -> int:
+    """Legge un (Multi)Polygon WKB/EWKB da pos, aggiunge gli anelli (array Nx2) a rings."""
+    order = "<" if buf[pos] == 1 else ">"
+    (gtype,) = struct.unpack_from(order + "I", buf, pos + 1)
+    pos += 5
+
+    dims = 2 + bool(gtype & EWKB_Z_FLAG) + bool(gtype & EWKB_M_FLAG)
+    if gtype & EWKB_SRID_FLAG:
+        pos += 4
+    base = gtype & 0x0FFFFFFF
+    # ISO WKB: Z/M codificati come +1000/+2000/+3000
+    dims += (base // 1000 in (1, 2)) + 2 * (base // 1000 == 3)
+    base %= 1000
+
+    if base == WKB_MULTIPOLYGON:
+        (n_polys,) = struct.unpack_from(order + "I", buf, pos)
+        pos += 4
+        for _ in range(n_polys):
+            pos = _read_geometry(buf, pos, rings)
+        return pos
+
+    if base != WKB_POLYGON:
+        raise ValueError(f"Geometria WKB non supportata: tipo {base}")
+
+    (n_rings,) = struct.unpack_from(order + "I", buf, pos)
+    pos += 4
+    dtype = np.dtype(np.float64).newbyteorder(order)
+    for _ in range(n_rings):
+        (n_points,) = struct.unpack_from(order + "I", buf, pos)
+        pos += 4
+        coords = np.frombuffer(buf, dtype=dtype, count=n_points * dims, offset=pos)
+        rings.append(coords.reshape(n_points, dims)[:, :2].astype(np.float64))
+        pos += 8 * n_points * dims
+    return pos
+
+
+def parse_wkb_rings(wkb_hex: str) -> list:
+    """Anelli (esterni e buchi) di un Polygon/MultiPolygon in hex (E)WKB."""
+    rings = []
+    _read_geometry(bytes.fromhex(wkb_hex), 0, rings)
+    return rings
+
+
+# =============================================================================
+# INDICE
+# =============================================================================
+
+class CityAreasIndex:
+    """
+    Aree di servizio impacchettate + griglia sui bounding box.
+
+    coords        (V, 2) tutti i vertici di tutti gli anelli
+    ring_offsets  (R+1,) anello r = coords[ring_offsets[r]:ring_offsets[r+1]]
+    city_rings    (C+1,) anelli della città i = city_rings[i]:city_rings[i+1]
+    """
+
+    def __init__(self, city_ids, rings_per_city, cell_deg=GRID_CELL_DEG):
+        self.city_ids = np.asarray(city_ids, dtype=np.int64)
+        self.cell_deg = cell_deg
+
+        rings = [r for city in rings_per_city for r in city]
+        self.coords = np.concatenate(rings) if rings else np.empty((0, 2))
+        self.ring_offsets = np.concatenate([[0], np.cumsum([len(r) for r in rings])]).astype(np.int64)
+        self.city_rings = np.concatenate([[0], np.cumsum([len(c) for c in rings_per_city])]).astype(np.int64)
+
+        self.bbox = np.empty((len(rings_per_city), 4))
+        for i, city in enumerate(rings_per_city):
+            pts = np.concatenate(city)
+            self.bbox[i] = [*pts.min(axis=0), *pts.max(axis=0)]
+        self._city_pos = {int(cid): i for i, cid in enumerate(self.city_ids)}
+        self._build_grid()
+
+    @classmethod
+    def from_csv(cls, path: Path = DATA_DIR / "city_areas.csv", cell_deg=GRID_CELL_DEG):
+        df = pd.read_csv(path, usecols=["city_id", "geom_ewkb"]).dropna()
+        return cls(df["city_id"], [parse_wkb_rings(h) for h in df["geom_ewkb"]], cell_deg)
+
+    # -------------------------------------------------------------------------
+    # griglia
+    # -------------------------------------------------------------------------
+
+    def _cell(self, lon, lat):
+        ix = np.floor((np.asarray(lon) + 180.0) / self.cell_deg).astype(np.int64)
+        iy = np.floor((np.asarray(lat) + 90.0) / self.cell_deg).astype(np.int64)
+        return ix, iy
+
+    def _cell_key(self, ix, iy):
+        return ix * (1 << 32) + iy
+
+    def _build_grid(self):
+        """Coppie (cella, città) ordinate per cella: lookup con searchsorted."""
+        keys, cities = [], []
+        x0, y0 = self._cell(self.bbox[:, 0], self.bbox[:, 1])
+        x1, y1 = self._cell(self.bbox[:, 2], self.bbox[:, 3])
+        for i in range(len(self.city_ids)):
+            gx, gy = np.meshgrid(np.arange(x0[i], x1[i] + 1), np.arange(y0[i], y1[i] + 1))
+            k = self._cell_key(gx.ravel(), gy.ravel())
+            keys.append(k)
+            cities.append(np.full(len(k), i, dtype=np.int64))
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        cities = np.concatenate(cities) if cities else np.empty(0, dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        self.grid_keys = keys[order]
+        self.grid_cities = cities[order]
+
+    # -------------------------------------------------------------------------
+    # point in polygon
+    # -------------------------------------------------------------------------
+
+    def _inside_city(self, i: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Ray casting pari/dispari su tutti gli anelli della città i (buchi inclusi)."""
+        inside = np.zeros(len(x), dtype=bool)
+        for r in range(self.city_rings[i], self.city_rings[i + 1]):
+            ring = self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]]
+            xs, ys = ring[:, 0], ring[:, 1]
+            for j in range(len(ring) - 1):
+                x1, y1, x2, y2 = xs[j], ys[j], xs[j + 1], ys[j + 1]
+                if y1 == y2:
+                    continue
+                crosses = (y1 > y) != (y2 > y)
+                x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                inside ^= crosses & (x < x_cross)
+        return inside
+
+    def contains(self, city_ids, lon, lat) -> np.ndarray:
+        """
+        True dove il punto (lon, lat) cade nell'area della propria città.
+        Punti senza coordinate o di città senza area -> False.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        result = np.zeros(len(lon), dtype=bool)
+
+        for city_id, group in city_groups(city_ids, lon, lat):
+            i = self._city_pos.get(city_id)
+            if i is None:
+                continue
+            x, y = lon[group], lat[group]
+            b = self.bbox[i]
+            in_box = (x >= b[0]) & (x <= b[2]) & (y >= b[1]) & (y <= b[3])
+            hit = np.zeros(len(group), dtype=bool)
+            hit[in_box] = self._inside_city(i, x[in_box], y[in_box])
+            result[group] = hit
+        return result
+
+    def locate(self, lon, lat) -> np.ndarray:
+        """city_id dell'area che contiene ogni punto, -1 se nessuna."""
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        result = np.full(len(lon), -1, dtype=np.int64)
+
+        valid = np.flatnonzero(~(np.isnan(lon) | np.isnan(lat)))
+        keys = self._cell_key(*self._cell(lon[valid], lat[valid]))
+        lo = np.searchsorted(self.grid_keys, keys, side="left")
+        hi = np.searchsorted(self.grid_keys, keys, side="right")
+
+        # coppie (punto, città candidata)
+        counts = hi - lo
+        point = np.repeat(valid, counts)
+        slot = np.repeat(lo - np.cumsum(np.r_[0, counts[:-1]]), counts) + np.arange(counts.sum())
+        cand = self.grid_cities[slot]
+
+        hit = self.contains(self.city_ids[cand], lon[point], lat[point])
+        # le aree non si sovrappongono: basta assegnare i candidati colpiti
+        result[point[hit]] = self.city_ids[cand[hit]]
+        return result
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Geofencing dei trips sulle aree delle città")
+    parser.add_argument("trips_csv", type=Path, nargs="?", default=DATA_DIR / "trips.csv")
+    parser.add_argument("--areas", type=Path, default=DATA_DIR / "city_areas.csv")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    index = CityAreasIndex.from_csv(args.areas)
+    print(f"✓ {len(index.city_ids)} aree, {len(index.coords)} vertici, "
+          f"{len(index.grid_keys)} celle in {time.perf_counter() - t0:.2f}s")
+
+    trips = pd.read_csv(args.trips_csv)
+    t0 = time.perf_counter()
+    start_in = index.contains(trips["city_id"], trips["lon_start"], trips["lat_start"])
+    end_in = index.contains(trips["city_id"], trips["lon_end"], trips["lat_end"])
+    elapsed = time.perf_counter() - t0
+
+    print(f"Trips: {len(trips)} ({2 * len(trips) / elapsed:,.0f} punti/s)")
+    print(f"  partenza fuori area: {(~start_in).sum()}")
+    print(f"  arrivo fuori area:   {(~end_in).sum()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Funzioni comuni agli script: distanze, punti raggruppati per città, ora locale
+
+Importate dall'import (03_import_data), dallo snapping stazioni, dal
+geofencing, dalle catene di trips, dalle heatmap e dalle matrici OD, così
+che costanti e conversioni restino le stesse ovunque.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+EARTH_RADIUS_M = 6_371_008.8
+
+
+# =============================================================================
+# DISTANZE
+# =============================================================================
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    """Distanza great-circle in metri, vettoriale su array numpy/Series."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=np.float64))
+                              for v in (lon1, lat1, lon2, lat2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# =============================================================================
+# PUNTI PER CITTÀ
+# =============================================================================
+
+def city_groups(city_ids, lon, lat):
+    """
+    (city_id, posizioni) dei punti con coordinate e città note, una città
+    alla volta: un solo argsort stabile sui city_id e poi slicing, niente
+    groupby né maschere per città.
+    """
+    city_ids = np.asarray(city_ids)
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    idx = np.flatnonzero(~(np.isnan(lon) | np.isnan(lat) | pd.isna(city_ids)))
+    if len(idx) == 0:
+        return
+    cids = city_ids[idx].astype(np.int64)
+    order = np.argsort(cids, kind="stable")
+    idx, cids = idx[order], cids[order]
+    starts = np.flatnonzero(np.r_[True, cids[1:] != cids[:-1]])
+    ends = np.r_[starts[1:], len(cids)]
+    for s, e in zip(starts, ends):
+        yield int(cids[s]), idx[s:e]
+
+
+# =============================================================================
+# ORA LOCALE
+# =============================================================================
+
+def epoch_to_utc(epoch) -> pd.Series:
+    """Secondi epoch (float, NaN ammessi) -> timestamp UTC, tutto il blocco insieme."""
+    s = pd.Series(epoch)
+    return pd.to_datetime(s.astype("float64"), unit="s", utc=True)
+
+
+def local_times(utc: pd.Series, city_ids, city_tz) -> pd.Series:
+    """
+    Ora locale (senza fuso) della città di ogni riga; city_tz è un dict o
+    una Series city_id -> timezone. Una tz_convert per fuso orario presente
+    nel blocco, non per riga; NaT se il fuso è ignoto.
+    """
+    tz = pd.Series(np.asarray(city_ids), index=utc.index).map(city_tz)
+    codes, zones = pd.factorize(tz)
+    out = np.full(len(utc), np.datetime64("NaT"), dtype="datetime64[ns]")
+    for k, zone in enumerate(zones):
+        pos = np.flatnonzero(codes == k)
+        local = utc.iloc[pos].dt.tz_convert(zone).dt.tz_localize(None)
+        out[pos] = local.to_numpy(dtype="datetime64[ns]")
+    return pd.Series(out, index=utc.index)
+
+
+def local_hours(time_start, city_ids, city_tz) -> np.ndarray:
+    """Ora locale (0-23) da secondi epoch; ora UTC se il fuso manca, 0 se manca l'orario."""
+    utc = epoch_to_utc(np.asarray(time_start, dtype=np.float64))
+    local = local_times(utc, city_ids, city_tz)
+    hours = local.dt.hour.fillna(utc.dt.hour)
+    return hours.to_numpy(dtype=np.int64, na_value=0)
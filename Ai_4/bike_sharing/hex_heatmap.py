@@ -0,0 +1,236 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Heatmap della domanda su griglia esagonale
+
+Le coordinate di partenza e arrivo dei trips vengono assegnate a celle
+esagonali (pointy-top, coordinate assiali q/r) di lato configurabile in
+metri. La proiezione è equirettangolare locale centrata sulla città
+(lat/lon di cities.csv): a scala urbana l'errore è trascurabile e gli
+id di cella restano stabili tra un run e l'altro.
+
+Per ogni (città, cella, ora locale, partenza/arrivo) si salvano solo somme
+e conteggi (additivi tra blocchi): numero di trips, durata media e
+consumo medio di batteria si ricavano dai file, qualche KB per
+risoluzione invece di una scansione di trips.
+
+Esecuzione:
+    python hex_heatmap.py build data/trips.csv --sizes 250 500 1000
+    python hex_heatmap.py top 177 --size 500 --hour 8 --kind start
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from geo_utils import EARTH_RADIUS_M, local_hours
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+HEX_DIR = DATA_DIR / "hex_heatmap"
+
+# lato dell'esagono in metri, una heatmap per lato
+DEFAULT_SIZES_M = (250, 500, 1000)
+
+KINDS = {"start": 0, "end": 1}
+
+HEX_COLUMNS = {
+    "city_id": np.int32,
+    "q": np.int32,
+    "r": np.int32,
+    "hour": np.uint8,
+    "kind": np.uint8,
+    "n": np.uint32,
+    "sum_duration": np.float64,
+    "n_battery": np.uint32,
+    "sum_drain": np.float64,
+}
+
+SQRT3 = np.sqrt(3.0)
+
+
+# =============================================================================
+# GEOMETRIA ESAGONALE
+# =============================================================================
+
+def project(lon, lat, lon0, lat0):
+    """lon/lat -> metri (x est, y nord) rispetto all'origine della città."""
+    lon = np.radians(np.asarray(lon, dtype=np.float64) - lon0)
+    lat = np.radians(np.asarray(lat, dtype=np.float64) - lat0)
+    return EARTH_RADIUS_M * lon * np.cos(np.radians(lat0)), EARTH_RADIUS_M * lat
+
+
+def unproject(x, y, lon0, lat0):
+    lon = lon0 + np.degrees(np.asarray(x) / (EARTH_RADIUS_M * np.cos(np.radians(lat0))))
+    lat = lat0 + np.degrees(np.asarray(y) / EARTH_RADIUS_M)
+    return lon, lat
+
+
+def hex_cells(x, y, size_m: float):
+    """Punti in metri -> cella esagonale (q, r) con arrotondamento in coordinate cubiche."""
+    qf = (SQRT3 / 3.0 * x - y / 3.0) / size_m
+    rf = (2.0 / 3.0 * y) / size_m
+    sf = -qf - rf
+
+    q, r, s = np.round(qf), np.round(rf), np.round(sf)
+    dq, dr, ds = np.abs(q - qf), np.abs(r - rf), np.abs(s - sf)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+    return q.astype(np.int32), r.astype(np.int32)
+
+
+def hex_centers(q, r, size_m: float):
+    """Centro (metri) delle celle (q, r)."""
+    q = np.asarray(q, dtype=np.float64)
+    r = np.asarray(r, dtype=np.float64)
+    return size_m * SQRT3 * (q + r / 2.0), size_m * 1.5 * r
+
+
+# =============================================================================
+# AGGREGAZIONE
+# =============================================================================
+
+def load_cities(path: Path = DATA_DIR / "cities.csv") -> pd.DataFrame:
+    """Origine della proiezione e fuso orario di ogni città."""
+    return pd.read_csv(path, usecols=["id", "lat", "lon", "timezone"]).dropna(
+        subset=["lat", "lon"]).set_index("id")
+
+
+def hex_aggregate(trips: pd.DataFrame, cities: pd.DataFrame, size_m: float) -> pd.DataFrame:
+    """Somme e conteggi per (città, q, r, ora, partenza/arrivo) di un blocco di trips."""
+    t = trips.dropna(subset=["city_id", "time_start"])
+    t = t[t["city_id"].isin(cities.index)]
+    city_ids = t["city_id"].to_numpy(dtype=np.int64)
+    origin = cities.loc[city_ids]
+    hour = local_hours(t["time_start"], city_ids, cities["timezone"])
+    duration = t["duration"].to_numpy(dtype=np.float64)
+    drain = (t["battery_start"] - t["battery_end"]).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    parts = []
+    for kind, code in KINDS.items():
+        lon = t[f"lon_{kind}"].to_numpy(dtype=np.float64)
+        lat = t[f"lat_{kind}"].to_numpy(dtype=np.float64)
+        ok = ~(np.isnan(lon) | np.isnan(lat))
+        x, y = project(lon[ok], lat[ok], origin["lon"].to_numpy()[ok], origin["lat"].to_numpy()[ok])
+        q, r = hex_cells(x, y, size_m)
+        parts.append(pd.DataFrame({
+            "city_id": city_ids[ok],
+            "q": q,
+            "r": r,
+            "hour": hour[ok],
+            "kind": code,
+            "n": 1,
+            "sum_duration": np.nan_to_num(duration[ok]),
+            "n_battery": ~np.isnan(drain[ok]),
+            "sum_drain": np.nan_to_num(drain[ok]),
+        }))
+    return merge_cells(parts)
+
+
+def merge_cells(frames) -> pd.DataFrame:
+    """Ricombina aggregati (di blocchi diversi) della stessa cella."""
+    df = pd.concat(frames, ignore_index=True)
+    keys = ["city_id", "q", "r", "hour", "kind"]
+    df = df.groupby(keys, sort=True, as_index=False)[["n", "sum_duration", "n_battery", "sum_drain"]].sum()
+    return df.astype(HEX_COLUMNS)
+
+
+def build_heatmaps(csv_path: Path, sizes=DEFAULT_SIZES_M, cities_path: Path = DATA_DIR / "cities.csv",
+                   chunksize=1_000_000) -> dict:
+    """Legge i trips a blocchi: size -> aggregati per cella."""
+    cities = load_cities(cities_path)
+    parts = {size: [] for size in sizes}
+    usecols = ["city_id", "time_start", "duration", "battery_start", "battery_end",
+               "lon_start", "lat_start", "lon_end", "lat_end"]
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, usecols=usecols):
+        for size in sizes:
+            parts[size].append(hex_aggregate(chunk, cities, size))
+    return {size: merge_cells(frames) for size, frames in parts.items() if frames}
+
+
+def save_heatmaps(heatmaps: dict, out_dir: Path = HEX_DIR):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for size, df in heatmaps.items():
+        np.savez_compressed(out_dir / f"hex_{size}m.npz",
+                            **{c: df[c].to_numpy(dtype=dtype) for c, dtype in HEX_COLUMNS.items()})
+
+
+# =============================================================================
+# QUERY
+# =============================================================================
+
+def load_heatmap(city_id: int, size_m: int, hour=None, kind="start", hex_dir: Path = HEX_DIR,
+                 cities_path: Path = DATA_DIR / "cities.csv") -> pd.DataFrame:
+    """
+    Celle di una città con centro (lon/lat), trips, durata media e consumo
+    medio di batteria. hour = ora locale (o lista di ore), None = tutte.
+    """
+    with np.load(hex_dir / f"hex_{size_m}m.npz") as f:
+        df = pd.DataFrame({c: f[c] for c in HEX_COLUMNS})
+    mask = (df["city_id"] == city_id) & (df["kind"] == KINDS[kind])
+    if hour is not None:
+        mask &= df["hour"].isin(np.atleast_1d(hour))
+    df = df[mask].groupby(["q", "r"], as_index=False)[["n", "sum_duration", "n_battery", "sum_drain"]].sum()
+
+    origin = load_cities(cities_path).loc[city_id]
+    lon, lat = unproject(*hex_centers(df["q"], df["r"], size_m), origin["lon"], origin["lat"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({
+            "q": df["q"],
+            "r": df["r"],
+            "lon": lon,
+            "lat": lat,
+            "trips": df["n"],
+            "mean_duration": df["sum_duration"] / df["n"],
+            "mean_battery_drain": np.where(df["n_battery"] > 0, df["sum_drain"] / df["n_battery"], np.nan),
+        }).sort_values("trips", ascending=False, kind="stable").reset_index(drop=True)
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Heatmap esagonali della domanda")
+    parser.add_argument("--hex-dir", type=Path, default=HEX_DIR)
+    parser.add_argument("--cities", type=Path, default=DATA_DIR / "cities.csv")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="aggrega i trips di un CSV")
+    p_build.add_argument("csv", type=Path, nargs="?", default=DATA_DIR / "trips.csv")
+    p_build.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES_M),
+                         help="lato degli esagoni in metri")
+    p_build.add_argument("--chunk-size", type=int, default=1_000_000)
+
+    p_top = sub.add_parser("top", help="celle con più trips di una città")
+    p_top.add_argument("city_id", type=int)
+    p_top.add_argument("--size", type=int, default=DEFAULT_SIZES_M[1])
+    p_top.add_argument("--hour", type=int, default=None)
+    p_top.add_argument("--kind", choices=sorted(KINDS), default="start")
+    p_top.add_argument("--n", type=int, default=10)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        heatmaps = build_heatmaps(args.csv, args.sizes, args.cities, args.chunk_size)
+        save_heatmaps(heatmaps, args.hex_dir)
+        print(f"✓ Heatmap in {time.perf_counter() - t0:.2f}s ({args.hex_dir})")
+        for size, df in heatmaps.items():
+            kb = (args.hex_dir / f"hex_{size}m.npz").stat().st_size / 1024
+            print(f"  - lato {size:>5} m: {len(df):>8} righe (cella, ora, tipo), {kb:8.1f} KB")
+    else:
+        df = load_heatmap(args.city_id, args.size, args.hour, args.kind, args.hex_dir, args.cities)
+        print(df.head(args.n).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Matrici origine-destinazione (OD) sparse dai trips
+
+Per ogni città le stazioni vengono mappate su indici densi 0..n-1 e i
+flussi station_id_start -> station_id_end vengono accumulati (COO, con
+somma dei duplicati) in una matrice SciPy CSR di forma (24 * n, n):
+la riga hour * n + i contiene i trips partiti dalla stazione i in
+quell'ora locale della città (fuso da cities.csv, come hex_heatmap e
+trips.time_start_local). Una città = un file .npz compresso + gli id stazione.
+Top-N flussi e inflow netto per stazione si calcolano dai file, senza
+interrogare PostgreSQL.
+
+Esecuzione:
+    python od_matrix.py build data/trips.csv
+    python od_matrix.py top 177 --n 10 --hour 8
+    python od_matrix.py inflow 177
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from geo_utils import local_hours
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+OD_DIR = DATA_DIR / "od_matrix"
+
+HOURS = 24
+
+
+# =============================================================================
+# BUILD
+# =============================================================================
+
+def load_timezones(path: Path = DATA_DIR / "cities.csv") -> pd.Series:
+    """city_id -> timezone."""
+    return pd.read_csv(path, usecols=["id", "timezone"]).dropna().set_index("id")["timezone"]
+
+
+def od_counts(trips: pd.DataFrame, timezones: pd.Series) -> pd.DataFrame:
+    """
+    Conteggi (city_id, hour, station_start, station_end) di un blocco di trips.
+    hour = ora locale della città di time_start (UTC se il fuso manca).
+    Trips senza stazioni sono scartati.
+    """
+    t = trips.dropna(subset=["city_id", "time_start", "station_id_start", "station_id_end"])
+    city_ids = t["city_id"].to_numpy(dtype=np.int64)
+    keys = pd.DataFrame({
+        "city_id": city_ids,
+        "hour": local_hours(t["time_start"], city_ids, timezones),
+        "start": t["station_id_start"].to_numpy(dtype=np.int64),
+        "end": t["station_id_end"].to_numpy(dtype=np.int64),
+    })
+    return keys.value_counts().rename("trips").reset_index()
+
+
+def build_od_matrices(counts: pd.DataFrame) -> dict:
+    """city_id -> (station_ids, CSR (24*n, n)) dai conteggi aggregati."""
+    counts = counts.groupby(["city_id", "hour", "start", "end"], as_index=False)["trips"].sum()
+    matrices = {}
+    for city_id, g in counts.groupby("city_id"):
+        station_ids, inverse = np.unique(
+            np.concatenate([g["start"].to_numpy(), g["end"].to_numpy()]), return_inverse=True
+        )
+        n = len(station_ids)
+        origin, dest = inverse[: len(g)], inverse[len(g):]
+        rows = g["hour"].to_numpy() * n + origin
+        m = sparse.coo_matrix(
+            (g["trips"].to_numpy(dtype=np.int32), (rows, dest)), shape=(HOURS * n, n)
+        ).tocsr()
+        matrices[int(city_id)] = (station_ids, m)
+    return matrices
+
+
+def build_from_csv(csv_path: Path, chunksize=1_000_000,
+                   cities_path: Path = DATA_DIR / "cities.csv") -> dict:
+    """Legge i trips a blocchi: in memoria restano solo le coppie OD distinte."""
+    timezones = load_timezones(cities_path)
+    parts = [od_counts(chunk, timezones) for chunk in pd.read_csv(
+        csv_path, chunksize=chunksize,
+        usecols=["city_id", "time_start", "station_id_start", "station_id_end"],
+    )]
+    return build_od_matrices(pd.concat(parts, ignore_index=True))
+
+
+def save_od_matrices(matrices: dict, out_dir: Path = OD_DIR):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for city_id, (station_ids, m) in matrices.items():
+        sparse.save_npz(out_dir / f"city_{city_id}.npz", m, compressed=True)
+        np.save(out_dir / f"city_{city_id}_stations.npy", station_ids)
+
+
+def load_od_matrix(city_id: int, od_dir: Path = OD_DIR):
+    """(station_ids, CSR (24*n, n)) di una città."""
+    m = sparse.load_npz(od_dir / f"city_{city_id}.npz").tocsr()
+    station_ids = np.load(od_dir / f"city_{city_id}_stations.npy")
+    return station_ids, m
+
+
+# =============================================================================
+# QUERY
+# =============================================================================
+
+def od_for_hours(m, n: int, hour=None):
+    """Matrice n x n per un'ora (o lista di ore); None = tutte le ore sommate."""
+    hours = range(HOURS) if hour is None else np.atleast_1d(hour)
+    out = sparse.csr_matrix((n, n), dtype=m.dtype)
+    for h in hours:
+        out = out + m[h * n:(h + 1) * n]
+    return out
+
+
+def top_flows(city_id: int, n=10, hour=None, od_dir: Path = OD_DIR) -> pd.DataFrame:
+    """Le n coppie (origine, destinazione) con più trips."""
+    station_ids, m = load_od_matrix(city_id, od_dir)
+    od = od_for_hours(m, len(station_ids), hour).tocoo()
+    best = np.argsort(od.data, kind="stable")[::-1][:n]
+    return pd.DataFrame({
+        "station_id_start": station_ids[od.row[best]],
+        "station_id_end": station_ids[od.col[best]],
+        "trips": od.data[best],
+    })
+
+
+def net_inflow(city_id: int, hour=None, od_dir: Path = OD_DIR) -> pd.Series:
+    """Arrivi - partenze per stazione (positivo = la stazione si riempie)."""
+    station_ids, m = load_od_matrix(city_id, od_dir)
+    od = od_for_hours(m, len(station_ids), hour)
+    inflow = np.asarray(od.sum(axis=0)).ravel()
+    outflow = np.asarray(od.sum(axis=1)).ravel()
+    return pd.Series(inflow - outflow, index=pd.Index(station_ids, name="station_id"),
+                     name="net_inflow").sort_values(ascending=False)
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Matrici OD sparse dai trips")
+    parser.add_argument("--od-dir", type=Path, default=OD_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="costruisce le matrici da un CSV di trips")
+    p_build.add_argument("csv", type=Path, nargs="?", default=DATA_DIR / "trips.csv")
+    p_build.add_argument("--chunk-size", type=int, default=1_000_000)
+    p_build.add_argument("--cities", type=Path, default=DATA_DIR / "cities.csv")
+
+    p_top = sub.add_parser("top", help="top-N flussi di una città")
+    p_top.add_argument("city_id", type=int)
+    p_top.add_argument("--n", type=int, default=10)
+    p_top.add_argument("--hour", type=int, default=None, help="ora locale")
+
+    p_inflow = sub.add_parser("inflow", help="inflow netto per stazione")
+    p_inflow.add_argument("city_id", type=int)
+    p_inflow.add_argument("--hour", type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"Costruzione matrici OD da {args.csv}...")
+        matrices = build_from_csv(args.csv, args.chunk_size, args.cities)
+        save_od_matrices(matrices, args.od_dir)
+        nnz = sum(m.nnz for _, m in matrices.values())
+        print(f"✓ {len(matrices)} città, {nnz} coppie OD non nulle in {args.od_dir}")
+    elif args.command == "top":
+        print(top_flows(args.city_id, args.n, args.hour, args.od_dir).to_string(index=False))
+    else:
+        print(net_inflow(args.city_id, args.hour, args.od_dir).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Cache di staging Parquet per i CSV di data/
+
+Ogni import rilegge e riparsa gli stessi CSV, con pandas che indovina i
+tipi: gli id con NaN diventano float64, time_start un float epoch. Qui ogni
+CSV viene convertito una sola volta in data/staging/<nome>.parquet con tipi
+espliciti (interi nullable, float64, timestamp UTC, stringhe, booleani
+nullable). Le letture successive proiettano solo le
+colonne richieste e usano il memory map di pyarrow.
+
+La cache è valida finché il CSV (e lo schema) non cambia: se mtime e
+dimensione coincidono con quelli salvati nel .meta.json si riusa subito; se l'mtime è cambiato si
+ricalcola lo sha256 del file e si riconverte solo se il contenuto è diverso.
+
+Esecuzione:
+    python staging_cache.py build
+    python staging_cache.py build trips.csv --force
+    python staging_cache.py info
+"""
+
+import argparse
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# tipo speciale: epoch in secondi nel CSV -> timestamp UTC nel Parquet
+TIMESTAMP = "timestamp"
+
+# CSV -> colonna -> dtype pandas. Tutti i float restano float64: finiscono in
+# colonne DOUBLE PRECISION e in float32 un import con --staging caricherebbe
+# valori diversi da quelli del CSV (distance sbaglia già alla quarta decimale).
+STAGING_SCHEMAS = {
+    "cities.csv": {
+        "id": "Int64",
+        "name": "string",
+        "lat": "float64",
+        "lon": "float64",
+        "timezone": "string",
+        "country": "string",
+        "return_to_official_only": "boolean",
+    },
+    "bike_types.csv": {
+        "id": "Int64",
+        "vehicle_image": "string",
+        "name": "string",
+        "description": "string",
+        "form_factor": "string",
+        "rider_capacity": "Int16",
+        "propulsion_type": "string",
+        "max_range": "float64",
+        "battery_capacity": "float64",
+    },
+    "bikes.csv": {
+        "id": "Int64",
+        "bike_type_id": "Int64",
+        "computer_id": "Int64",
+    },
+    "stations.csv": {
+        "id": "Int64",
+        "city_id": "Int64",
+        "name": "string",
+        "app_number": "string",
+        "terminal_type": "string",
+        "place_type": "string",
+        "bike_racks": "Int32",
+        "special_racks": "Int32",
+        "rack_locks": "Int32",
+        "lon": "float64",
+        "lat": "float64",
+    },
+    "city_areas.csv": {
+        "city_id": "Int64",
+        "geom_ewkb": "string",
+        "geom_ewkt": "string",
+        "geom_geojson": "string",
+    },
+    "station_status.csv": {
+        "station_id": "Int64",
+        "time": TIMESTAMP,
+        "bikes": "Int32",
+        "booked_bikes": "Int32",
+        "bikes_available_to_rent": "Int32",
+        "free_racks": "Int32",
+        "free_special_racks": "Int32",
+        "maintenance": "boolean",
+    },
+    "trips.csv": {
+        "bike_id": "Int64",
+        "city_id": "Int64",
+        "time_start": TIMESTAMP,
+        "lon_start": "float64",
+        "lat_start": "float64",
+        "lon_end": "float64",
+        "lat_end": "float64",
+        "station_id_start": "Int64",
+        "station_id_end": "Int64",
+        "battery_start": "float64",
+        "battery_end": "float64",
+        "duration": "float64",
+        "distance": "float64",
+    },
+}
+
+# righe per blocco di conversione (= una row group del Parquet)
+CONVERT_CHUNKSIZE = 1_000_000
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def staging_dir(data_dir: Path = DATA_DIR) -> Path:
+    return data_dir / "staging"
+
+
+def staging_paths(filename: str, data_dir: Path = DATA_DIR):
+    """(csv, parquet, meta.json) di un file di data/."""
+    stem = Path(filename).stem
+    out = staging_dir(data_dir)
+    return data_dir / filename, out / f"{stem}.parquet", out / f"{stem}.meta.json"
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def typed_frame(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """Applica lo schema di staging a un blocco letto dal CSV."""
+    out = {}
+    for col in df.columns:
+        dtype = schema.get(col)
+        s = df[col]
+        if dtype is None:
+            out[col] = s
+        elif dtype == TIMESTAMP:
+            out[col] = pd.to_datetime(pd.to_numeric(s), unit="s", utc=True)
+        elif dtype in ("string", "boolean"):
+            out[col] = s.astype(dtype)
+        else:
+            out[col] = pd.to_numeric(s).astype(dtype)
+    return pd.DataFrame(out, index=df.index)
+
+
+def csv_read_options(schema: dict) -> dict:
+    """
+    Opzioni di pd.read_csv: stringhe e booleani letti già col tipo giusto
+    (un "00123" resta tale), il resto numerico e convertito in typed_frame.
+    """
+    dtype = {c: t for c, t in schema.items() if t in ("string", "boolean")}
+    return {"dtype": dtype}
+
+
+def epoch_seconds(s: pd.Series) -> pd.Series:
+    """Timestamp (UTC) -> secondi epoch float64, NaT -> NaN: il formato del CSV."""
+    values = s.to_numpy(dtype="datetime64[ns]", na_value=np.datetime64("NaT"))
+    out = values.astype(np.int64) / 1e9
+    out[np.isnat(values)] = np.nan
+    return pd.Series(out, index=s.index, name=s.name)
+
+
+# =============================================================================
+# CACHE
+# =============================================================================
+
+def read_meta(meta_path: Path):
+    try:
+        return json.loads(meta_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def is_fresh(filename: str, data_dir: Path = DATA_DIR) -> bool:
+    """
+    True se il Parquet corrisponde al CSV attuale e a STAGING_SCHEMAS. Con
+    mtime/dimensione cambiati ma stesso sha256 (es. file ricopiato) aggiorna
+    solo il meta.
+    """
+    csv_path, parquet_path, meta_path = staging_paths(filename, data_dir)
+    meta = read_meta(meta_path)
+    if meta is None or not parquet_path.exists():
+        return False
+    if meta.get("schema") != STAGING_SCHEMAS.get(filename, {}):
+        return False
+
+    st = csv_path.stat()
+    if meta["mtime_ns"] == st.st_mtime_ns and meta["size"] == st.st_size:
+        return True
+    if meta["size"] != st.st_size or meta["sha256"] != file_sha256(csv_path):
+        return False
+
+    meta["mtime_ns"] = st.st_mtime_ns
+    meta_path.write_text(json.dumps(meta, indent=2))
+    return True
+
+
+def build_parquet(filename: str, data_dir: Path = DATA_DIR, chunksize=CONVERT_CHUNKSIZE) -> dict:
+    """Converte un CSV in Parquet tipizzato (a blocchi: memoria limitata dal chunk)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    csv_path, parquet_path, meta_path = staging_paths(filename, data_dir)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"File CSV non trovato: {csv_path}")
+    schema = STAGING_SCHEMAS.get(filename, {})
+
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = parquet_path.with_suffix(".parquet.tmp")
+    st = csv_path.stat()
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, **csv_read_options(schema)):
+            table = pa.Table.from_pandas(typed_frame(chunk, schema), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # CSV con il solo header: Parquet vuoto con le colonne giuste
+        empty = typed_frame(pd.read_csv(csv_path, nrows=0, **csv_read_options(schema)), schema)
+        pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), tmp_path)
+    tmp_path.replace(parquet_path)
+
+    meta = {
+        "source": filename,
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "sha256": file_sha256(csv_path),
+        "rows": rows,
+        "schema": schema,
+    }
+    meta_path.write_text(json.dumps(meta, indent=2))
+    return meta
+
+
+def ensure_parquet(filename: str, data_dir: Path = DATA_DIR, force=False) -> Path:
+    """Path del Parquet di filename, (ri)costruito se mancante o non aggiornato."""
+    _, parquet_path, _ = staging_paths(filename, data_dir)
+    if force or not is_fresh(filename, data_dir):
+        build_parquet(filename, data_dir)
+    return parquet_path
+
+
+# =============================================================================
+# LETTURA
+# =============================================================================
+
+def read_staged(filename: str, columns=None, data_dir: Path = DATA_DIR,
+                as_epoch=False) -> pd.DataFrame:
+    """
+    Intero file dalla cache (solo le colonne richieste, memory-mapped).
+    as_epoch=True riporta i timestamp a secondi epoch float64 come nel CSV.
+    """
+    import pyarrow.parquet as pq
+
+    path = ensure_parquet(filename, data_dir)
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return staged_frame(table, as_epoch)
+
+
+def read_staged_chunks(filename: str, chunksize=None, skip_rows=0, columns=None,
+                       data_dir: Path = DATA_DIR, as_epoch=False):
+    """
+    Stessa interfaccia di read_csv_chunks dell'import: un DataFrame unico
+    (chunksize=None) o blocchi da chunksize righe, saltando le prime skip_rows.
+    """
+    import pyarrow.parquet as pq
+
+    path = ensure_parquet(filename, data_dir)
+    if chunksize is None:
+        table = pq.read_table(path, columns=columns, memory_map=True)
+        yield staged_frame(table.slice(skip_rows), as_epoch)
+        return
+
+    pf = pq.ParquetFile(path, memory_map=True)
+    pending = skip_rows
+    for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+        if pending >= batch.num_rows:
+            pending -= batch.num_rows
+            continue
+        if pending:
+            batch, pending = batch.slice(pending), 0
+        yield staged_frame(batch, as_epoch)
+
+
+def staged_frame(table, as_epoch=False) -> pd.DataFrame:
+    """Table/RecordBatch pyarrow -> DataFrame con i dtype nullable di pandas."""
+    df = table.to_pandas(types_mapper=_nullable_dtype)
+    if as_epoch:
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                df[col] = epoch_seconds(df[col])
+    return df
+
+
+def _nullable_dtype(arrow_type):
+    """Interi, booleani e stringhe Arrow -> Int*/boolean/string di pandas."""
+    import pyarrow as pa
+
+    if pa.types.is_boolean(arrow_type):
+        return pd.BooleanDtype()
+    if pa.types.is_signed_integer(arrow_type):
+        return pd.api.types.pandas_dtype(f"Int{arrow_type.bit_width}")
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype()
+    return None
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache Parquet dei CSV di data/")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="converte i CSV (solo quelli cambiati)")
+    p_build.add_argument("files", nargs="*", default=sorted(STAGING_SCHEMAS))
+    p_build.add_argument("--force", action="store_true", help="riconverte comunque")
+
+    sub.add_parser("info", help="stato della cache")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for filename in args.files:
+            if not (args.data_dir / filename).exists():
+                print(f"  - {filename:<20} assente, saltato")
+                continue
+            if not args.force and is_fresh(filename, args.data_dir):
+                print(f"  ✓ {filename:<20} già aggiornato")
+                continue
+            t0 = time.perf_counter()
+            meta = build_parquet(filename, args.data_dir)
+            print(f"  ✓ {filename:<20} {meta['rows']:>10,} righe in {time.perf_counter() - t0:.2f}s")
+    else:
+        for filename in sorted(STAGING_SCHEMAS):
+            csv_path, parquet_path, _ = staging_paths(filename, args.data_dir)
+            if not csv_path.exists():
+                continue
+            if not parquet_path.exists():
+                print(f"  {filename:<20} non in cache")
+                continue
+            state = "aggiornato" if is_fresh(filename, args.data_dir) else "da ricostruire"
+            ratio = parquet_path.stat().st_size / csv_path.stat().st_size
+            print(f"  {filename:<20} {state:<15} {ratio:6.1%} della dimensione del CSV")
+
+
+if __name__ == "__main__":
+    main()
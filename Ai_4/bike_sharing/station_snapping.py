@@ -0,0 +1,166 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Snapping dei trips sulla stazione più vicina
+
+Molti trips hanno coordinate ma station_id_start/station_id_end mancanti
+(o non presenti in stations.csv): ensure_stations_for_trips creerebbe
+stazioni segnaposto con coordinate NULL. Qui per ogni città si costruisce
+un KD-tree (scipy cKDTree) sulle stazioni, con lat/lon convertite in punti
+3D sulla sfera unitaria: la distanza euclidea (corda) è monotona con quella
+geodetica, quindi la soglia in metri diventa una soglia sulla corda.
+Ogni città viene interrogata con una sola query batch su tutti i punti.
+
+Esecuzione:
+    python station_snapping.py data/trips.csv --max-distance 150
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from geo_utils import EARTH_RADIUS_M, city_groups
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# distanza massima (metri) tra punto del trip e stazione per fare snapping
+DEFAULT_MAX_DISTANCE_M = 100.0
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def lonlat_to_unit_xyz(lon, lat) -> np.ndarray:
+    """(lon, lat) in gradi -> punti (N, 3) sulla sfera unitaria."""
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def meters_to_chord(meters: float) -> float:
+    """Distanza geodetica (m) -> lunghezza della corda sulla sfera unitaria."""
+    return 2.0 * np.sin(meters / (2.0 * EARTH_RADIUS_M))
+
+
+def chord_to_meters(chord) -> np.ndarray:
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+# =============================================================================
+# SNAPPER
+# =============================================================================
+
+class StationSnapper:
+    """Un KD-tree per città sulle stazioni con coordinate note."""
+
+    def __init__(self, stations: pd.DataFrame, max_distance_m=DEFAULT_MAX_DISTANCE_M):
+        self.max_distance_m = max_distance_m
+        stations = stations.dropna(subset=["id", "city_id", "lon", "lat"])
+        self.known_ids = np.unique(stations["id"].to_numpy(dtype=np.int64))
+
+        self.trees = {}
+        for city_id, group in stations.groupby("city_id"):
+            xyz = lonlat_to_unit_xyz(group["lon"], group["lat"])
+            self.trees[int(city_id)] = (cKDTree(xyz), group["id"].to_numpy(dtype=np.int64))
+
+    @classmethod
+    def from_csv(cls, path: Path = DATA_DIR / "stations.csv", max_distance_m=DEFAULT_MAX_DISTANCE_M):
+        return cls(pd.read_csv(path, usecols=["id", "city_id", "lon", "lat"]), max_distance_m)
+
+    def nearest(self, city_ids, lon, lat):
+        """
+        Stazione più vicina (della stessa città) entro max_distance_m.
+        Ritorna (station_id, distanza in metri): -1 / NaN dove non trovata.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        out_ids = np.full(len(lon), -1, dtype=np.int64)
+        out_dist = np.full(len(lon), np.nan)
+
+        bound = meters_to_chord(self.max_distance_m)
+        for city_id, group in city_groups(city_ids, lon, lat):
+            entry = self.trees.get(city_id)
+            if entry is None:
+                continue
+            tree, station_ids = entry
+            dist, pos = tree.query(lonlat_to_unit_xyz(lon[group], lat[group]),
+                                   distance_upper_bound=bound)
+            found = np.isfinite(dist)
+            out_ids[group[found]] = station_ids[pos[found]]
+            out_dist[group[found]] = chord_to_meters(dist[found])
+        return out_ids, out_dist
+
+    def snap_trips(self, trips: pd.DataFrame, replace_unknown=False):
+        """
+        Riempie station_id_start/station_id_end mancanti (NaN) con la stazione
+        più vicina. replace_unknown=True tratta come mancanti anche gli id
+        assenti dalle stazioni note (ha senso solo con stations.csv completo:
+        sui sample da 1000 righe quasi tutti gli id sarebbero "sconosciuti").
+        Ritorna (trips aggiornati, statistiche per estremo).
+        """
+        trips = trips.copy()
+        stats = {}
+        for end in ("start", "end"):
+            col = f"station_id_{end}"
+            current = trips[col]
+            unusable = current.isna().to_numpy()
+            if replace_unknown:
+                unusable |= ~np.isin(current.fillna(-1).to_numpy(dtype=np.int64), self.known_ids)
+            rows = np.flatnonzero(unusable)
+
+            ids, _ = self.nearest(
+                trips["city_id"].to_numpy()[rows],
+                trips[f"lon_{end}"].to_numpy()[rows],
+                trips[f"lat_{end}"].to_numpy()[rows],
+            )
+            snapped = ids >= 0
+            values = current.astype("Int64").to_numpy(copy=True)
+            values[rows[snapped]] = ids[snapped]
+            trips[col] = pd.array(values, dtype="Int64")
+
+            stats[end] = {"candidates": len(rows), "snapped": int(snapped.sum()),
+                          "unmatched": int((~snapped).sum())}
+        return trips, stats
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapping trips -> stazione più vicina")
+    parser.add_argument("trips_csv", type=Path, nargs="?", default=DATA_DIR / "trips.csv")
+    parser.add_argument("--stations", type=Path, default=DATA_DIR / "stations.csv")
+    parser.add_argument("--max-distance", type=float, default=DEFAULT_MAX_DISTANCE_M,
+                        help="soglia in metri")
+    parser.add_argument("--replace-unknown", action="store_true",
+                        help="aggancia anche gli id assenti da stations.csv")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    snapper = StationSnapper.from_csv(args.stations, args.max_distance)
+    print(f"✓ KD-tree per {len(snapper.trees)} città in {time.perf_counter() - t0:.2f}s")
+
+    trips = pd.read_csv(args.trips_csv)
+    t0 = time.perf_counter()
+    _, stats = snapper.snap_trips(trips, args.replace_unknown)
+    elapsed = time.perf_counter() - t0
+
+    print(f"Trips: {len(trips)} in {elapsed:.2f}s")
+    for end, s in stats.items():
+        print(f"  {end:<5}: {s['candidates']} senza stazione, "
+              f"{s['snapped']} agganciati, {s['unmatched']} non agganciati")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Store colonnare compatto per gli snapshot di station_status
+
+station_status.csv contiene snapshot periodici (bikes, booked_bikes,
+free_racks, ...) per stazione e istante epoch: in produzione milioni di
+righe al giorno. Qui ogni blocco importato diventa un "segmento" su disco,
+una colonna per file .npy con il tipo più piccolo che basta:
+
+    station_id  int32        time      int64 (secondi epoch)
+    contatori   uint8/uint16 maintenance  bit-packed (np.packbits)
+
+Per ogni segmento vengono salvati anche i rollup orari e giornalieri
+(somme, conteggi, min/max per stazione e bucket), additivi tra segmenti:
+le query di disponibilità per stazione leggono solo quelli.
+
+Ogni segmento ricorda il CSV da cui viene (percorso, dimensione, mtime,
+sha256): reimportare lo stesso file non aggiunge nulla, mentre un file
+cambiato sostituisce i segmenti della versione precedente. Senza questo i
+rollup, additivi, conterebbero due volte gli stessi snapshot.
+
+Esecuzione:
+    python station_status_store.py ingest data/station_status.csv
+    python station_status_store.py query 39482836 --freq daily
+"""
+
+import argparse
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from staging_cache import file_sha256
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+STORE_DIR = Path(__file__).resolve().parent / "data" / "station_status_store"
+
+# colonna -> dtype su disco (maintenance è a parte, bit-packed)
+STATUS_COLUMNS = {
+    "station_id": np.int32,
+    "time": np.int64,
+    "bikes": np.uint16,
+    "booked_bikes": np.uint8,
+    "bikes_available_to_rent": np.uint16,
+    "free_racks": np.uint16,
+    "free_special_racks": np.uint8,
+}
+
+ROLLUP_FREQS = {
+    "hourly": 3600,
+    "daily": 86400,
+}
+
+# colonne dei rollup: somme e conteggi si possono sommare tra segmenti
+ROLLUP_COLUMNS = {
+    "station_id": np.int32,
+    "bucket": np.int64,
+    "n": np.uint32,
+    "sum_bikes": np.uint32,
+    "min_bikes": np.uint16,
+    "max_bikes": np.uint16,
+    "sum_free_racks": np.uint32,
+    "n_available": np.uint32,
+    "n_maintenance": np.uint32,
+}
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def checked_cast(values, dtype, name: str) -> np.ndarray:
+    """Cast a dtype compatto: errore (non wrap-around) se un valore non ci sta."""
+    values = np.asarray(values)
+    info = np.iinfo(dtype)
+    if values.size and (values.min() < info.min or values.max() > info.max):
+        raise ValueError(
+            f"{name}: valori fuori dal range di {np.dtype(dtype).name} "
+            f"[{values.min()}, {values.max()}]"
+        )
+    return values.astype(dtype)
+
+
+def status_columns(df: pd.DataFrame) -> dict:
+    """DataFrame di station_status.csv -> colonne numpy compatte."""
+    df = df.dropna(subset=["station_id", "time"])
+    cols = {}
+    for name, dtype in STATUS_COLUMNS.items():
+        values = df[name].to_numpy()
+        if name == "time":
+            values = np.floor(values)
+        elif name != "station_id":
+            values = np.nan_to_num(values.astype(np.float64), nan=0)
+        cols[name] = checked_cast(values, dtype, name)
+    cols["maintenance"] = df["maintenance"].fillna(False).to_numpy(dtype=bool)
+    return cols
+
+
+def write_columns(path: Path, cols: dict, meta: dict = None):
+    """Una colonna per file .npy; i bool vengono salvati bit-packed."""
+    path.mkdir(parents=True, exist_ok=True)
+    n_rows = len(next(iter(cols.values()))) if cols else 0
+    for name, values in cols.items():
+        if values.dtype == bool:
+            np.save(path / f"{name}.bits.npy", np.packbits(values))
+        else:
+            np.save(path / f"{name}.npy", values)
+    (path / "meta.json").write_text(json.dumps({"rows": n_rows, **(meta or {})}))
+
+
+def read_columns(path: Path, columns=None, mmap=True) -> dict:
+    """Legge (memory-mapped) le colonne di un segmento."""
+    meta = json.loads((path / "meta.json").read_text())
+    out = {}
+    for f in sorted(path.glob("*.npy")):
+        if f.name.endswith(".bits.npy"):
+            name = f.name[: -len(".bits.npy")]
+            if columns is None or name in columns:
+                bits = np.load(f)
+                out[name] = np.unpackbits(bits, count=meta["rows"]).astype(bool)
+        else:
+            name = f.stem
+            if columns is None or name in columns:
+                out[name] = np.load(f, mmap_mode="r" if mmap else None)
+    return out
+
+
+def source_info(csv_path: Path) -> dict:
+    """Identità del CSV sorgente salvata nel meta.json di ogni segmento."""
+    csv_path = Path(csv_path).resolve()
+    st = csv_path.stat()
+    return {
+        "path": str(csv_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": file_sha256(csv_path),
+    }
+
+
+def same_source(a: dict, b: dict) -> bool:
+    """Stesso file e stesso contenuto (mtime diverso ma sha256 uguale conta come uguale)."""
+    return a["path"] == b["path"] and a["size"] == b["size"] and a["sha256"] == b["sha256"]
+
+
+def source_segments(store_dir: Path, path: str) -> list:
+    """(nome segmento, meta) dei segmenti importati dal CSV path."""
+    out = []
+    for d in segment_dirs(store_dir):
+        meta = json.loads((d / "meta.json").read_text())
+        if meta.get("source", {}).get("path") == path:
+            out.append((d.name, meta))
+    return out
+
+
+def drop_segments(store_dir: Path, names):
+    """Rimuove segmenti e relativi rollup."""
+    for kind in ("segments", *ROLLUP_FREQS):
+        for name in names:
+            shutil.rmtree(store_dir / kind / name, ignore_errors=True)
+
+
+def segment_dirs(store_dir: Path, kind="segments", t_min=None, t_max=None):
+    """Segmenti di store_dir/kind, saltando quelli fuori da [t_min, t_max]."""
+    base = store_dir / kind
+    if not base.exists():
+        return []
+    dirs = []
+    for d in sorted(p for p in base.iterdir() if p.is_dir()):
+        meta = json.loads((d / "meta.json").read_text())
+        if t_min is not None and meta.get("t_max") is not None and meta["t_max"] < t_min:
+            continue
+        if t_max is not None and meta.get("t_min") is not None and meta["t_min"] > t_max:
+            continue
+        dirs.append(d)
+    return dirs
+
+
+# =============================================================================
+# ROLLUP
+# =============================================================================
+
+def compute_rollup(cols: dict, bucket_seconds: int) -> dict:
+    """Aggrega gli snapshot per (station_id, bucket di bucket_seconds)."""
+    df = pd.DataFrame({
+        "station_id": cols["station_id"],
+        "bucket": cols["time"] // bucket_seconds * bucket_seconds,
+        "bikes": cols["bikes"].astype(np.int64),
+        "free_racks": cols["free_racks"].astype(np.int64),
+        "available": cols["bikes_available_to_rent"] > 0,
+        "maintenance": cols["maintenance"],
+    })
+    g = df.groupby(["station_id", "bucket"], sort=True)
+    agg = g.agg(
+        n=("bikes", "size"),
+        sum_bikes=("bikes", "sum"),
+        min_bikes=("bikes", "min"),
+        max_bikes=("bikes", "max"),
+        sum_free_racks=("free_racks", "sum"),
+        n_available=("available", "sum"),
+        n_maintenance=("maintenance", "sum"),
+    ).reset_index()
+    return {name: agg[name].to_numpy().astype(dtype) for name, dtype in ROLLUP_COLUMNS.items()}
+
+
+def merge_rollups(frames) -> pd.DataFrame:
+    """Ricombina rollup di segmenti diversi che condividono (stazione, bucket)."""
+    df = pd.concat(frames, ignore_index=True)
+    if df.empty:
+        return df
+    return df.groupby(["station_id", "bucket"], sort=True).agg(
+        n=("n", "sum"),
+        sum_bikes=("sum_bikes", "sum"),
+        min_bikes=("min_bikes", "min"),
+        max_bikes=("max_bikes", "max"),
+        sum_free_racks=("sum_free_racks", "sum"),
+        n_available=("n_available", "sum"),
+        n_maintenance=("n_maintenance", "sum"),
+    ).reset_index()
+
+
+# =============================================================================
+# INGEST / QUERY
+# =============================================================================
+
+def ingest_frame(df: pd.DataFrame, store_dir: Path = STORE_DIR, source: dict = None) -> int:
+    """
+    Aggiunge un blocco di snapshot allo store come nuovo segmento + rollup.
+    source (vedi source_info) finisce nel meta.json del segmento; chi chiama
+    ingest_frame direttamente senza source non ha il controllo dei duplicati.
+    """
+    cols = status_columns(df)
+    n = len(cols["time"])
+    if n == 0:
+        return 0
+
+    existing = segment_dirs(store_dir)
+    seg_id = int(existing[-1].name) + 1 if existing else 0
+    name = f"{seg_id:06d}"
+    meta = {"t_min": int(cols["time"].min()), "t_max": int(cols["time"].max())}
+    if source is not None:
+        meta["source"] = source
+    write_columns(store_dir / "segments" / name, cols, meta)
+    for freq, seconds in ROLLUP_FREQS.items():
+        write_columns(store_dir / freq / name, compute_rollup(cols, seconds), meta)
+    return n
+
+
+def ingest_csv(csv_path: Path, store_dir: Path = STORE_DIR, chunksize=1_000_000) -> int:
+    """
+    Importa station_status.csv a blocchi di chunksize righe. Se lo stesso
+    file (stesso sha256) è già stato importato per intero non fa nulla e
+    ritorna 0; se è cambiato, o l'import precedente si era interrotto, i
+    suoi segmenti vengono rimossi e il file reimportato.
+    """
+    source = source_info(csv_path)
+    previous = source_segments(store_dir, source["path"])
+    if previous and all(same_source(m["source"], source) for _, m in previous) \
+            and any(m["source"].get("complete") for _, m in previous):
+        print(f"  {source['path']} già importato ({len(previous)} segmenti), salto")
+        return 0
+    if previous:
+        print(f"  {source['path']} cambiato o incompleto: sostituisco {len(previous)} segmenti")
+        drop_segments(store_dir, [name for name, _ in previous])
+
+    total = 0
+    for df in pd.read_csv(csv_path, chunksize=chunksize):
+        total += ingest_frame(df, store_dir, source)
+        print(f"  Importati {total} snapshot...")
+
+    # marcato solo a fine file: un import interrotto a metà non passa per già fatto
+    written = source_segments(store_dir, source["path"])
+    if written:
+        name, meta = written[-1]
+        meta["source"]["complete"] = True
+        (store_dir / "segments" / name / "meta.json").write_text(json.dumps(meta))
+    return total
+
+
+def load_snapshots(store_dir: Path = STORE_DIR, columns=None, t_min=None, t_max=None) -> pd.DataFrame:
+    """Snapshot grezzi (solo le colonne richieste) nell'intervallo [t_min, t_max]."""
+    parts = []
+    for d in segment_dirs(store_dir, "segments", t_min, t_max):
+        cols = read_columns(d, None if columns is None else set(columns) | {"time"})
+        part = pd.DataFrame(cols)
+        mask = np.ones(len(part), dtype=bool)
+        if t_min is not None:
+            mask &= part["time"].to_numpy() >= t_min
+        if t_max is not None:
+            mask &= part["time"].to_numpy() <= t_max
+        parts.append(part[mask])
+    if not parts:
+        return pd.DataFrame(columns=list(columns or STATUS_COLUMNS))
+    df = pd.concat(parts, ignore_index=True)
+    return df if columns is None else df[list(columns)]
+
+
+def station_availability(station_id: int, freq="hourly", t_min=None, t_max=None,
+                         store_dir: Path = STORE_DIR) -> pd.DataFrame:
+    """
+    Disponibilità di una stazione per bucket orario/giornaliero, letta dai
+    rollup: bici medie/min/max, rastrelliere libere medie, quota di snapshot
+    con almeno una bici noleggiabile e quota in manutenzione.
+    """
+    frames = []
+    for d in segment_dirs(store_dir, freq, t_min, t_max):
+        cols = read_columns(d)
+        mask = cols["station_id"] == station_id
+        if t_min is not None:
+            mask &= cols["bucket"] >= t_min // ROLLUP_FREQS[freq] * ROLLUP_FREQS[freq]
+        if t_max is not None:
+            mask &= cols["bucket"] <= t_max
+        if mask.any():
+            frames.append(pd.DataFrame({k: np.asarray(v)[mask] for k, v in cols.items()}))
+
+    if not frames:
+        return pd.DataFrame(columns=["bucket", "n", "mean_bikes", "min_bikes", "max_bikes",
+                                     "mean_free_racks", "availability", "maintenance_ratio"])
+
+    r = merge_rollups(frames)
+    return pd.DataFrame({
+        "bucket": pd.to_datetime(r["bucket"], unit="s", utc=True),
+        "n": r["n"],
+        "mean_bikes": r["sum_bikes"] / r["n"],
+        "min_bikes": r["min_bikes"],
+        "max_bikes": r["max_bikes"],
+        "mean_free_racks": r["sum_free_racks"] / r["n"],
+        "availability": r["n_available"] / r["n"],
+        "maintenance_ratio": r["n_maintenance"] / r["n"],
+    })
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Store colonnare station_status")
+    parser.add_argument("--store", type=Path, default=STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="importa un CSV station_status nello store")
+    p_ingest.add_argument("csv", type=Path)
+    p_ingest.add_argument("--chunk-size", type=int, default=1_000_000)
+
+    p_query = sub.add_parser("query", help="disponibilità di una stazione dai rollup")
+    p_query.add_argument("station_id", type=int)
+    p_query.add_argument("--freq", choices=sorted(ROLLUP_FREQS), default="hourly")
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        print(f"Importazione {args.csv} in {args.store}...")
+        total = ingest_csv(args.csv, args.store, args.chunk_size)
+        segments = segment_dirs(args.store)
+        rows = sum(json.loads((d / "meta.json").read_text())["rows"] for d in segments)
+        size = sum(f.stat().st_size for d in segments for f in d.glob("*.npy"))
+        print(f"✓ {total} snapshot importati, {rows} nello store "
+              f"({size / max(rows, 1):.1f} byte/riga su disco)")
+    else:
+        print(station_availability(args.station_id, args.freq, store_dir=args.store).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
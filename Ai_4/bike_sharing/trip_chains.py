@@ -0,0 +1,225 @@
+"""
+CASE STUDY: Sistema di Bike Sharing Europeo (Dataset Reale)
+Catene di trips per bici e ricollocamenti dello staff
+
+Per ogni bike_id i trips ordinati per time_start formano una catena: se
+l'arrivo di un trip è lontano dalla partenza del trip successivo della
+stessa bici, nel frattempo qualcuno l'ha spostata (ricollocamento).
+
+Il file viene letto a blocchi in due passate, senza loop per bici:
+  1. ogni blocco viene diviso in bucket per bike_id % n_buckets e salvato
+     su disco (solo le colonne che servono): tutti i trips di una bici
+     finiscono nello stesso bucket;
+  2. ogni bucket viene caricato da solo, ordinato con un unico lexsort
+     su (bike_id, time_start) e confrontato con sé stesso shiftato di uno.
+La memoria dipende dalla dimensione di un bucket, non dal file.
+
+Esecuzione:
+    python trip_chains.py data/trips.csv --min-distance 250
+    python trip_chains.py --staging --buckets 64 --chunk-size 2000000
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from geo_utils import haversine_m
+
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+OUT_DIR = DATA_DIR / "trip_chains"
+
+# distanza minima (metri) tra arrivo e partenza successiva per un ricollocamento
+DEFAULT_MIN_DISTANCE_M = 200.0
+
+DEFAULT_BUCKETS = 16
+
+CHAIN_COLUMNS = {
+    "bike_id": np.int64,
+    "city_id": np.float64,
+    "time_start": np.float64,
+    "duration": np.float64,
+    "lon_start": np.float64,
+    "lat_start": np.float64,
+    "lon_end": np.float64,
+    "lat_end": np.float64,
+}
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def chain_columns(df: pd.DataFrame) -> dict:
+    """Colonne numpy della catena; i trips senza bici o senza orario non servono."""
+    df = df.dropna(subset=["bike_id", "time_start"])
+    cols = {"bike_id": df["bike_id"].to_numpy(dtype=np.int64)}
+    for c, dtype in CHAIN_COLUMNS.items():
+        if c not in cols:
+            cols[c] = df[c].to_numpy(dtype=dtype, na_value=np.nan)
+    return cols
+
+
+def read_trip_chunks(csv_path: Path, chunksize: int, staging=False):
+    """Blocchi di trips con le sole CHAIN_COLUMNS (dal CSV o dalla cache Parquet)."""
+    if staging:
+        from staging_cache import read_staged_chunks
+        yield from read_staged_chunks(csv_path.name, chunksize, columns=list(CHAIN_COLUMNS),
+                                      data_dir=csv_path.parent, as_epoch=True)
+    else:
+        yield from pd.read_csv(csv_path, chunksize=chunksize, usecols=list(CHAIN_COLUMNS))
+
+
+# =============================================================================
+# PASSATA 1: BUCKET PER BICI
+# =============================================================================
+
+def spill_buckets(chunks, tmp_dir: Path, n_buckets=DEFAULT_BUCKETS) -> int:
+    """Scrive ogni blocco diviso per bike_id % n_buckets (un .npz per bucket e blocco)."""
+    total = 0
+    for i, df in enumerate(chunks):
+        cols = chain_columns(df)
+        bucket = cols["bike_id"] % n_buckets
+        order = np.argsort(bucket, kind="stable")
+        bounds = np.searchsorted(bucket[order], np.arange(n_buckets + 1))
+        cols = {c: v[order] for c, v in cols.items()}
+
+        for b in np.flatnonzero(np.diff(bounds)):
+            lo, hi = bounds[b], bounds[b + 1]
+            np.savez(tmp_dir / f"bucket{b:04d}_{i:06d}.npz", **{c: v[lo:hi] for c, v in cols.items()})
+        total += len(order)
+    return total
+
+
+def load_bucket(tmp_dir: Path, b: int) -> dict:
+    parts = [np.load(f) for f in sorted(tmp_dir.glob(f"bucket{b:04d}_*.npz"))]
+    if not parts:
+        return None
+    return {c: np.concatenate([p[c] for p in parts]) for c in CHAIN_COLUMNS}
+
+
+# =============================================================================
+# PASSATA 2: CATENE
+# =============================================================================
+
+def chain_bucket(cols: dict, min_distance_m=DEFAULT_MIN_DISTANCE_M):
+    """
+    Ordina un bucket per (bike_id, time_start) e confronta ogni trip con il
+    successivo della stessa bici. Ritorna (ricollocamenti, per-bici) dove
+    idle = partenza successiva - (time_start + duration) del trip precedente.
+    """
+    order = np.lexsort((cols["time_start"], cols["bike_id"]))
+    c = {k: v[order] for k, v in cols.items()}
+    bike = c["bike_id"]
+
+    same = bike[1:] == bike[:-1]
+    end_time = c["time_start"][:-1] + np.nan_to_num(c["duration"][:-1])
+    idle = c["time_start"][1:] - end_time
+    gap = haversine_m(c["lon_end"][:-1], c["lat_end"][:-1], c["lon_start"][1:], c["lat_start"][1:])
+    moved = same & (gap > min_distance_m)
+
+    pos = np.flatnonzero(moved)
+    relocations = pd.DataFrame({
+        "bike_id": bike[pos],
+        "city_id_from": pd.array(c["city_id"][pos], dtype="Int64"),
+        "city_id_to": pd.array(c["city_id"][pos + 1], dtype="Int64"),
+        "time_end": end_time[pos],
+        "time_next_start": c["time_start"][pos + 1],
+        "idle_s": idle[pos],
+        "lon_from": c["lon_end"][pos],
+        "lat_from": c["lat_end"][pos],
+        "lon_to": c["lon_start"][pos + 1],
+        "lat_to": c["lat_start"][pos + 1],
+        "distance_m": gap[pos],
+    })
+
+    # statistiche per bici: un groupby sulle coppie consecutive, niente loop
+    pairs = pd.DataFrame({
+        "bike_id": bike[1:][same],
+        "idle_s": np.maximum(idle[same], 0.0),
+        "overlap": idle[same] < 0,
+        "relocated": moved[same],
+    })
+    per_bike = pairs.groupby("bike_id").agg(
+        n_gaps=("idle_s", "size"),
+        idle_mean_s=("idle_s", "mean"),
+        idle_median_s=("idle_s", "median"),
+        idle_max_s=("idle_s", "max"),
+        idle_total_s=("idle_s", "sum"),
+        n_overlaps=("overlap", "sum"),
+        n_relocations=("relocated", "sum"),
+    )
+    ids, n_trips = np.unique(bike, return_counts=True)
+    per_bike = per_bike.reindex(ids).rename_axis("bike_id")
+    per_bike.insert(0, "n_trips", n_trips)
+    counts = {"n_gaps": "int64", "n_overlaps": "int64", "n_relocations": "int64"}
+    per_bike = per_bike.fillna(dict.fromkeys(counts, 0)).astype(counts)
+    return relocations, per_bike.reset_index()
+
+
+def build_chains(csv_path: Path, chunksize=1_000_000, n_buckets=DEFAULT_BUCKETS,
+                 min_distance_m=DEFAULT_MIN_DISTANCE_M, staging=False):
+    """Due passate sul file: ritorna (ricollocamenti, statistiche per bici)."""
+    relocations, per_bike = [], []
+    with tempfile.TemporaryDirectory(prefix="trip_chains_") as tmp:
+        tmp_dir = Path(tmp)
+        spill_buckets(read_trip_chunks(csv_path, chunksize, staging), tmp_dir, n_buckets)
+        for b in range(n_buckets):
+            cols = load_bucket(tmp_dir, b)
+            if cols is None:
+                continue
+            r, s = chain_bucket(cols, min_distance_m)
+            relocations.append(r)
+            per_bike.append(s)
+
+    if not per_bike:
+        return pd.DataFrame(), pd.DataFrame()
+    relocations = pd.concat(relocations, ignore_index=True).sort_values(["bike_id", "time_end"])
+    per_bike = pd.concat(per_bike, ignore_index=True).sort_values("bike_id")
+    return relocations.reset_index(drop=True), per_bike.reset_index(drop=True)
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Catene di trips per bici e ricollocamenti")
+    parser.add_argument("trips_csv", type=Path, nargs="?", default=DATA_DIR / "trips.csv")
+    parser.add_argument("--min-distance", type=float, default=DEFAULT_MIN_DISTANCE_M,
+                        help="soglia in metri tra arrivo e partenza successiva")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS,
+                        help="più bucket = meno memoria nella seconda passata")
+    parser.add_argument("--staging", action="store_true",
+                        help="legge dalla cache Parquet (staging_cache.py)")
+    parser.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    relocations, per_bike = build_chains(args.trips_csv, args.chunk_size, args.buckets,
+                                         args.min_distance, args.staging)
+    elapsed = time.perf_counter() - t0
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    relocations.to_csv(args.out_dir / "relocations.csv", index=False)
+    per_bike.to_csv(args.out_dir / "bike_idle_stats.csv", index=False)
+
+    n_trips = int(per_bike["n_trips"].sum()) if len(per_bike) else 0
+    print(f"✓ {n_trips} trips di {len(per_bike)} bici in {elapsed:.2f}s")
+    print(f"  ricollocamenti (> {args.min_distance:.0f} m): {len(relocations)}")
+    if len(per_bike):
+        print(f"  idle mediano per bici: {per_bike['idle_median_s'].median() / 3600:.1f} h")
+    print(f"✓ Risultati in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()